@@ -0,0 +1,551 @@
+"""Mode cluster: satu proses front menerima webhook Telegram dan meneruskan update ke N proses worker.
+
+Update dirutekan berdasarkan hash user id sehingga percakapan seorang user selalu
+diproses oleh worker yang sama. State percakapan, draft session, dedupe update dan
+rate limit notifikasi group disimpan di SQLite bersama (--store) agar konsisten
+antar proses dan bertahan saat cluster di-restart dengan jumlah worker berbeda.
+Journal, index hash foto dan profil perjalanan juga satu file untuk semua worker;
+baris journal yang belum terkirim dari run sebelumnya di-replay oleh worker 0 saja.
+
+State ConversationHandler ditulis ke store setiap berubah, tetapi draft session hanya
+di-snapshot setiap SESSION_SNAPSHOT_INTERVAL dan saat worker berhenti normal. Jika worker
+mati mendadak, isian form sejak snapshot terakhir hilang dan user yang pindah worker diminta
+mengulang form (pesan session kedaluwarsa), bukan melanjutkan dengan data yang tidak lengkap.
+
+Contoh:
+    WEBHOOK_URL=https://bot.example.com/telegram python cluster.py --workers 4
+    python scripts/cluster_bench.py --workers 4 --users 500
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+import zlib
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from journal import Journal
+
+
+def worker_for(user_id, workers):
+    """Worker pemilik user; update tanpa user (mis. channel post) selalu ke worker 0."""
+    if user_id is None:
+        return 0
+    return zlib.crc32(str(user_id).encode()) % workers
+
+
+def user_id_of(data):
+    """User id dari JSON update mentah (from/user di objek update mana pun), tanpa Update.de_json."""
+    for value in data.values():
+        if isinstance(value, dict):
+            user = value.get('from') or value.get('user')
+            if isinstance(user, dict) and 'id' in user:
+                return user['id']
+    return None
+
+
+# ====== Store Bersama (SQLite WAL) ======
+class ClusterStore:
+    """State yang dipakai bersama oleh front dan semua worker dalam satu file SQLite."""
+
+    def __init__(self, path, timeout=10.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS updates (update_id INTEGER PRIMARY KEY, received REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, paused_until REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (user_id INTEGER PRIMARY KEY, worker INTEGER NOT NULL, data TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations (name TEXT, key TEXT, state TEXT NOT NULL, PRIMARY KEY (name, key))"
+        )
+
+    # ====== Dedupe Update ======
+    def record_updates(self, updates):
+        """Simpan (update_id, waktu diterima) dalam satu transaksi; dedupe sendiri dilakukan di memori front."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR IGNORE INTO updates (update_id, received) VALUES (?, ?)", updates)
+
+    def recent_updates(self, max_age):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT update_id, received FROM updates WHERE received >= ?", (time.time() - max_age,)
+            ).fetchall()
+
+    def prune_updates(self, max_age):
+        with self._lock:
+            return self._conn.execute("DELETE FROM updates WHERE received < ?", (time.time() - max_age,)).rowcount
+
+    # ====== Rate Limit ======
+    def take_token(self, key, rate, capacity):
+        """Ambil satu token dari bucket `key`; kembalikan 0 jika berhasil, selain itu detik yang perlu ditunggu."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = self._conn.execute(
+                "SELECT tokens, updated, paused_until FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated, paused_until = row or (capacity, now, 0.0)
+            if now < paused_until:
+                return paused_until - now
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, paused_until) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, paused_until)
+            )
+            return wait
+
+    def pause_bucket(self, key, seconds):
+        until = time.time() + seconds
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO buckets (key, tokens, updated, paused_until) VALUES (?, 0, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET tokens = 0, paused_until = MAX(paused_until, excluded.paused_until)",
+                (key, time.time(), until)
+            )
+
+    # ====== Session & State Percakapan ======
+    def save_sessions(self, worker, sessions):
+        """Ganti semua session milik worker dengan isi `sessions` (user_id -> dict)."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM sessions WHERE worker = ?", (worker,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sessions (user_id, worker, data) VALUES (?, ?, ?)",
+                [(int(user_id), worker, json.dumps(data)) for user_id, data in sessions.items()]
+            )
+
+    def load_sessions(self, worker, workers):
+        """Session user yang sekarang dimiliki worker (termasuk yang dulu disimpan worker lain)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, data FROM sessions").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows if worker_for(user_id, workers) == worker}
+
+    def save_conversation(self, name, key, state):
+        with self._lock:
+            if state is None:
+                self._conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, json.dumps(key)))
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                    (name, json.dumps(key), json.dumps(state))
+                )
+
+    def load_conversations(self, name, worker, workers):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        conversations = {}
+        for key, state in rows:
+            key = tuple(json.loads(key))
+            # Key (chat_id, user_id): elemen terakhir menentukan worker pemilik
+            if worker_for(key[-1], workers) == worker:
+                conversations[key] = json.loads(state)
+        return conversations
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SharedTokenBucket:
+    """Token bucket yang state-nya di ClusterStore, jadi batas kirim ke group berlaku untuk seluruh cluster."""
+
+    def __init__(self, store, key, rate, capacity):
+        self.store = store
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    def pause(self, seconds):
+        # Dipanggil dari event loop (notifier): tulis ke SQLite di thread tanpa ditunggu
+        future = asyncio.get_running_loop().run_in_executor(None, self.store.pause_bucket, self.key, seconds)
+        future.add_done_callback(self._paused)
+
+    @staticmethod
+    def _paused(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error pausing shared rate limit: {future.exception()}")
+
+    async def acquire(self):
+        while True:
+            wait = await asyncio.to_thread(self.store.take_token, self.key, self.rate, self.capacity)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class SharedPersistence(BasePersistence):
+    """Persistence PTB yang hanya menyimpan state ConversationHandler ke ClusterStore."""
+
+    def __init__(self, store, worker, workers, update_interval=60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.store = store
+        self.worker = worker
+        self.workers = workers
+
+    async def get_conversations(self, name):
+        return self.store.load_conversations(name, self.worker, self.workers)
+
+    async def update_conversation(self, name, key, new_state):
+        self.store.save_conversation(name, key, new_state)
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_user_data(self, user_id, data):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def drop_user_data(self, user_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        pass
+
+
+# ====== Worker ======
+def memory_storage_configured():
+    """Store memori hanya terlihat oleh satu proses, jadi /rekap tiap worker akan berbeda."""
+    backend = os.environ.get('STORAGE_BACKEND', 'sheets')
+    return backend == 'memory' or (backend == 'tee' and os.environ.get('STORAGE_TEE_LOCAL', 'sqlite') == 'memory')
+
+
+def worker_env(index, workers, store_path, replay_upto):
+    env = {
+        'CLUSTER_STORE_PATH': store_path,
+        'CLUSTER_WORKER': str(index),
+        'CLUSTER_WORKERS': str(workers),
+        'CLUSTER_REPLAY_UPTO': str(replay_upto),
+        'SESSION_SNAPSHOT_PATH': '',  # session disimpan di store bersama
+    }
+    metrics_port = int(os.environ.get('METRICS_PORT', '9464'))
+    if metrics_port:
+        env['METRICS_PORT'] = str(metrics_port + index)
+    return env
+
+
+def run_worker(index, queue, ready, processed, env, configure=None):
+    """Entry point proses worker: bangun Application dari main.py lalu proses update dari antrian front.
+
+    `configure(main)` opsional untuk mengganti ApplicationBuilder (mis. Bot API palsu saat benchmark).
+    """
+    # Shutdown dikoordinasikan oleh front lewat sentinel di antrian
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    os.environ.update(env)
+    asyncio.run(_serve_worker(index, queue, ready, processed, configure))
+
+
+async def _serve_worker(index, queue, ready, processed, configure):
+    from telegram import Update
+    from telegram.ext import Application, TypeHandler
+
+    import main
+
+    builder = configure(main) if configure is not None else None
+    application = main.build_application((builder or Application.builder().token(main.TELEGRAM_TOKEN)).updater(None))
+
+    async def count_processed(update, context):
+        with processed.get_lock():
+            processed.value += 1
+
+    # Grup terakhir: dihitung setelah handler form selesai
+    application.add_handler(TypeHandler(Update, count_processed), group=1)
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    if index == 0 and main.WEBHOOK_URL:
+        await application.bot.set_webhook(main.WEBHOOK_URL, secret_token=main.WEBHOOK_SECRET)
+        print(f"Webhook set to {main.WEBHOOK_URL}")
+    print(f"Cluster worker {index} ready (pid {os.getpid()})")
+    with ready.get_lock():
+        ready.value += 1
+
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+
+    def pump():
+        # Thread pembaca antrian multiprocessing; parsing JSON dilakukan di luar event loop
+        while True:
+            raw = queue.get()
+            if raw is None:
+                loop.call_soon_threadsafe(stopped.set)
+                return
+            update = Update.de_json(json.loads(raw), application.bot)
+            loop.call_soon_threadsafe(application.update_queue.put_nowait, update)
+
+    threading.Thread(target=pump, name='cluster-pump', daemon=True).start()
+    await stopped.wait()
+    # Urutan sama dengan run_polling: state percakapan terakhir ditulis saat shutdown()
+    await application.stop()
+    await application.shutdown()
+    await application.post_shutdown(application)
+
+
+class Cluster:
+    """Kelola proses worker dan antrian update masing-masing."""
+
+    def __init__(self, workers, store_path, configure=None):
+        context = multiprocessing.get_context('spawn')
+        self.workers = workers
+        self.store_path = store_path
+        # Batas replay: baris journal setelah id ini ditulis oleh worker yang sedang berjalan
+        journal = Journal(os.environ.get('JOURNAL_PATH', 'journal.db'))
+        self.replay_upto = journal.last_id()
+        journal.close()
+        self.queues = [context.Queue() for _ in range(workers)]
+        self.ready = context.Value('i', 0)
+        self.processed = context.Value('q', 0)
+        self.processes = [
+            context.Process(
+                target=run_worker, name=f'worker-{index}',
+                args=(
+                    index, self.queues[index], self.ready, self.processed,
+                    worker_env(index, workers, store_path, self.replay_upto), configure
+                )
+            )
+            for index in range(workers)
+        ]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def stop(self, timeout=60.0):
+        """Kirim sentinel ke semua worker, tunggu update yang tersisa selesai, lalu hentikan."""
+        for queue in self.queues:
+            queue.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                print(f"⚠️ {process.name} tidak berhenti dalam {timeout:g}s, dihentikan paksa")
+                process.terminate()
+
+
+# ====== Front (Webhook) ======
+class ClusterFront:
+    """Endpoint webhook minimal di atas asyncio: dedupe update lalu teruskan JSON mentah ke worker pemilik.
+
+    Dedupe memakai update_id di memori sehingga ack webhook tidak pernah menunggu SQLite; update_id baru
+    disimpan ke ClusterStore per batch di thread executor agar tetap dikenali setelah front restart.
+    """
+
+    def __init__(self, queues, store, host='0.0.0.0', port=8443, path='telegram', secret=None,
+                 dedupe_ttl=86400, persist_interval=1.0, max_body=1024 * 1024):
+        self.queues = queues
+        self.store = store
+        self.host = host
+        self.port = port
+        self.path = '/' + path.strip('/')
+        self.secret = secret
+        self.dedupe_ttl = dedupe_ttl
+        self.persist_interval = persist_interval
+        self.max_body = max_body
+        self.routed = [0] * len(queues)
+        self.duplicates = 0
+        self._seen = {}
+        self._pending = []
+        self._server = None
+        self._persister = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._seen = dict(await loop.run_in_executor(None, self.store.recent_updates, self.dedupe_ttl))
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self._persister = asyncio.create_task(self._persist_loop())
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._persister is not None:
+            self._persister.cancel()
+            self._persister = None
+        await self.persist()
+
+    async def persist(self):
+        """Tulis update_id yang baru diterima ke store (satu transaksi, di luar event loop)."""
+        batch, self._pending = self._pending, []
+        if batch:
+            await asyncio.get_running_loop().run_in_executor(None, self.store.record_updates, batch)
+
+    async def prune(self):
+        cutoff = time.time() - self.dedupe_ttl
+        self._seen = {update_id: received for update_id, received in self._seen.items() if received >= cutoff}
+        await asyncio.get_running_loop().run_in_executor(None, self.store.prune_updates, self.dedupe_ttl)
+
+    async def _persist_loop(self):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            try:
+                await self.persist()
+            except Exception as e:
+                print(f"Error persisting update ids: {e}")
+
+    def route(self, raw):
+        data = json.loads(raw)
+        update_id = data.get('update_id')
+        if update_id is not None:
+            if update_id in self._seen:
+                self.duplicates += 1
+                return
+            received = time.time()
+            self._seen[update_id] = received
+            self._pending.append((update_id, received))
+        worker = worker_for(user_id_of(data), len(self.queues))
+        self.queues[worker].put(raw)
+        self.routed[worker] += 1
+
+    async def _handle(self, reader, writer):
+        # Koneksi keep-alive: Telegram (dan generator lokal) mengirim beberapa request per koneksi
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                # Path, secret dan Content-Length dicek sebelum body dibaca; request yang ditolak
+                # tidak dibaca body-nya, jadi koneksinya langsung ditutup
+                parts = request_line.decode('latin-1').split()
+                length = headers.get('content-length', '0')
+                if len(parts) < 2 or parts[0] != 'POST' or parts[1].split('?')[0] != self.path:
+                    status = '404 Not Found'
+                elif self.secret and headers.get('x-telegram-bot-api-secret-token') != self.secret:
+                    status = '403 Forbidden'
+                elif not length.isdigit():
+                    status = '400 Bad Request'
+                elif int(length) > self.max_body:
+                    status = '413 Payload Too Large'
+                else:
+                    status = None
+                if status is not None:
+                    writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+                    await writer.drain()
+                    break
+
+                body = await reader.readexactly(int(length))
+                try:
+                    self.route(body)
+                    status = '200 OK'
+                except ValueError:
+                    status = '400 Bad Request'
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n\r\n".encode())
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"Error handling webhook request: {e}")
+        finally:
+            writer.close()
+
+
+async def serve_front(cluster, host, port, path, secret=None, prune_interval=3600, dedupe_ttl=86400):
+    store = ClusterStore(cluster.store_path)
+    front = ClusterFront(cluster.queues, store, host, port, path, secret, dedupe_ttl=dedupe_ttl)
+    await front.start()
+    print(f"Cluster front listening on {host}:{port}/{path.strip('/')} with {cluster.workers} workers")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), prune_interval)
+        except asyncio.TimeoutError:
+            try:
+                await front.prune()
+            except Exception as e:
+                print(f"Error pruning update ids: {e}")
+
+    await front.stop()
+    print(f"Routed per worker: {front.routed}, duplicates dropped: {front.duplicates}")
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--store', default=os.environ.get('CLUSTER_STORE_PATH', 'cluster.db'))
+    parser.add_argument('--listen', default=os.environ.get('WEBHOOK_LISTEN', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('WEBHOOK_PORT', os.environ.get('PORT', '8443'))))
+    parser.add_argument('--path', default=os.environ.get('WEBHOOK_PATH', 'telegram'))
+    args = parser.parse_args()
+    if memory_storage_configured():
+        parser.error("STORAGE_BACKEND memory (atau tee dengan STORAGE_TEE_LOCAL=memory) tidak bisa dipakai di mode cluster")
+
+    # Buat tabel sekali sebelum worker mulai
+    ClusterStore(args.store).close()
+    cluster = Cluster(args.workers, args.store)
+    cluster.start()
+    try:
+        asyncio.run(serve_front(cluster, args.listen, args.port, args.path, os.environ.get('WEBHOOK_SECRET') or None))
+    finally:
+        cluster.stop()
+
+
+if __name__ == '__main__':
+    main()
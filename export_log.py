@@ -0,0 +1,147 @@
+import csv
+import json
+import os
+from datetime import date
+
+import gspread
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow opsional: tanpa pyarrow hanya ekspor CSV
+    pyarrow = None
+
+from log_mirror import LAST_COLUMN, normalize_nip
+
+
+LOG_COLUMNS = ['timestamp', 'nama', 'nip', 'tujuan', 'periode', 'agenda', 'lat', 'lon', 'gmap', 'foto', 'status']
+
+
+# ====== Sumber Data (per potongan) ======
+def sheet_chunks(handle, sheet_names, chunk_size, start=None):
+    """Yield (cursor, rows) dari worksheet Log/shard per range A1, satu worksheet setelah yang lain.
+
+    cursor = [nama worksheet, baris sheet berikutnya]; worksheet sebelum `start` dilewati
+    dan worksheet yang tidak ada diabaikan.
+    """
+    if start is not None and start[0] in sheet_names:
+        sheet_names = sheet_names[sheet_names.index(start[0]):]
+    for sheet_name in sheet_names:
+        row = start[1] if start is not None and start[0] == sheet_name else 1
+        while True:
+            range_name = f"A{row}:{LAST_COLUMN}{row + chunk_size - 1}"
+            try:
+                values = handle.call(lambda sheet: sheet.get(range_name), sheet_name)
+            except gspread.exceptions.WorksheetNotFound:
+                break
+            row += len(values)
+            yield [sheet_name, row], values
+            if len(values) < chunk_size:
+                break
+
+
+def journal_chunks(journal, chunk_size, after_id=0):
+    """Yield (cursor, rows) dari journal lokal; cursor = id journal terakhir yang dibaca."""
+    while True:
+        entries = journal.rows_after(after_id, chunk_size)
+        if not entries:
+            return
+        after_id = entries[-1][0]
+        yield after_id, [row for _, row in entries]
+
+
+# ====== Filter ======
+def filter_rows(chunks, date_from=None, date_to=None, nip=None):
+    """Buang header/baris rusak dan baris di luar filter tanggal/NIP, per potongan."""
+    nip = normalize_nip(nip) if nip else None
+    for cursor, rows in chunks:
+        selected = []
+        for row in rows:
+            row = [str(value) for value in row] + [''] * (len(LOG_COLUMNS) - len(row))
+            try:
+                day = date.fromisoformat(row[0][:10])
+            except ValueError:
+                continue
+            if date_from and day < date_from or date_to and day > date_to:
+                continue
+            if nip and normalize_nip(row[2]) != nip:
+                continue
+            selected.append(row[:len(LOG_COLUMNS)])
+        yield cursor, selected
+
+
+# ====== Output ======
+class CsvSink:
+    """Tulis CSV secara append; posisi file dicatat agar resume bisa memotong sisa tulisan yang belum tercatat."""
+
+    def __init__(self, path, resume_size=None):
+        self.path = path
+        if resume_size is None:
+            self._file = open(path, 'w', newline='')
+            csv.writer(self._file).writerow(LOG_COLUMNS)
+        else:
+            self._file = open(path, 'r+', newline='')
+            self._file.truncate(resume_size)
+            self._file.seek(resume_size)
+        self._writer = csv.writer(self._file)
+
+    def write(self, chunk_index, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def position(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """Tulis satu file part Parquet per potongan di direktori output (part ulang ditimpa saat resume)."""
+
+    def __init__(self, path, resume_size=None):
+        if pyarrow is None:
+            raise RuntimeError("pyarrow tidak terpasang, ekspor Parquet tidak tersedia")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._schema = pyarrow.schema([(name, pyarrow.string()) for name in LOG_COLUMNS])
+
+    def write(self, chunk_index, rows):
+        if not rows:
+            return
+        columns = [pyarrow.array([row[i] for row in rows], pyarrow.string()) for i in range(len(LOG_COLUMNS))]
+        table = pyarrow.Table.from_arrays(columns, schema=self._schema)
+        pyarrow.parquet.write_table(table, os.path.join(self.path, f"part-{chunk_index:06d}.parquet"))
+
+    def position(self):
+        return None
+
+    def close(self):
+        pass
+
+
+# ====== Progress (resume) ======
+def load_progress(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_progress(path, progress):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
+
+
+def export(chunks, sink, progress_path, progress):
+    """Alirkan potongan ke sink; progress disimpan setelah setiap potongan selesai ditulis."""
+    for cursor, rows in chunks:
+        sink.write(progress['chunks'], rows)
+        progress['cursor'] = cursor
+        progress['chunks'] += 1
+        progress['rows'] += len(rows)
+        progress['size'] = sink.position()
+        save_progress(progress_path, progress)
+        yield progress
@@ -0,0 +1,35 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# ====== Cache file_id -> file_path ======
+class FilePathCache:
+    """Cache hasil getFile Telegram. Link download Telegram berlaku minimal satu jam,
+    jadi entri kedaluwarsa sedikit sebelum itu (ttl) dan jumlahnya dibatasi (LRU).
+    """
+
+    def __init__(self, ttl=3300, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_id):
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is None:
+                return None
+            file_path, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[file_id]
+                return None
+            self._entries.move_to_end(file_id)
+            return file_path
+
+    def put(self, file_id, file_path):
+        with self._lock:
+            self._entries[file_id] = (file_path, time.time() + self.ttl)
+            self._entries.move_to_end(file_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
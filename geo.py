@@ -0,0 +1,146 @@
+import csv
+import math
+import os
+import threading
+
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Jarak dua koordinat dalam meter."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+# ====== Spatial Index (Grid) ======
+class CircleIndex:
+    """Index grid untuk area berbentuk lingkaran (titik + radius).
+
+    Setiap lingkaran didaftarkan ke semua sel grid yang tertutup bounding box-nya,
+    sehingga query cukup membaca satu sel lalu mengecek jarak ke kandidat di sel itu.
+    """
+
+    def __init__(self, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self._cells = {}
+        self.count = 0
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def add(self, lat, lon, radius_m, label):
+        dlat = radius_m / METERS_PER_DEGREE
+        dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        row_min, col_min = self._cell(lat - dlat, lon - dlon)
+        row_max, col_max = self._cell(lat + dlat, lon + dlon)
+        entry = (lat, lon, radius_m, label)
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                self._cells.setdefault((row, col), []).append(entry)
+        self.count += 1
+
+    def find(self, lat, lon):
+        """Label lingkaran pertama yang memuat koordinat, atau None."""
+        for c_lat, c_lon, radius_m, label in self._cells.get(self._cell(lat, lon), ()):
+            if haversine_m(lat, lon, c_lat, c_lon) <= radius_m:
+                return label
+        return None
+
+
+def load_circles(path, label_field, cell_deg, default_radius_m):
+    """Muat CSV (lat,lon,radius_m,<label_field>) menjadi CircleIndex."""
+    index = CircleIndex(cell_deg)
+    if not path or not os.path.exists(path):
+        return index
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            radius_m = float(row.get('radius_m') or default_radius_m)
+            index.add(float(row['lat']), float(row['lon']), radius_m, row.get(label_field) or '')
+    return index
+
+
+# ====== Blacklist Spoofing & Geofence ======
+class GeoGuard:
+    """Blacklist titik spoofing dan geofence tujuan yang dimuat dari file lokal.
+
+    File dimuat ulang otomatis jika berubah (cek mtime lewat reload_if_changed),
+    dan index lama diganti secara atomik sehingga handler tidak perlu dikunci.
+    """
+
+    def __init__(self, blacklist_path, geofence_path, blacklist_radius_m=11.0, cell_deg=0.01):
+        self.blacklist_path = blacklist_path
+        self.geofence_path = geofence_path
+        self.blacklist_radius_m = blacklist_radius_m
+        self.cell_deg = cell_deg
+        self.blacklist = CircleIndex(cell_deg)
+        self.geofences = CircleIndex(cell_deg)
+        self._mtimes = None
+        self._lock = threading.Lock()
+
+    def _current_mtimes(self):
+        return tuple(
+            os.path.getmtime(path) if path and os.path.exists(path) else None
+            for path in (self.blacklist_path, self.geofence_path)
+        )
+
+    def reload(self):
+        with self._lock:
+            mtimes = self._current_mtimes()
+            blacklist = load_circles(self.blacklist_path, 'label', self.cell_deg, self.blacklist_radius_m)
+            # Geofence memakai sel lebih besar karena radiusnya dalam skala kilometer
+            geofences = load_circles(self.geofence_path, 'name', self.cell_deg * 5, 1000.0)
+            self.blacklist, self.geofences = blacklist, geofences
+            self._mtimes = mtimes
+        return blacklist.count, geofences.count
+
+    def reload_if_changed(self):
+        if self._current_mtimes() != self._mtimes:
+            return self.reload()
+        return None
+
+    def is_blacklisted(self, lat, lon):
+        return self.blacklist.find(lat, lon) is not None
+
+    def geofence_for(self, lat, lon):
+        return self.geofences.find(lat, lon)
+
+
+# ====== Index Lokasi Terakhir per NIP ======
+class TravelIndex:
+    """Lokasi & waktu terakhir yang dikonfirmasi per NIP untuk deteksi perjalanan mustahil.
+
+    Setiap lokasi baru cukup dibandingkan dengan satu entri (O(1)) tanpa membaca ulang sheet.
+    """
+
+    def __init__(self, max_speed_kmh=1000.0, min_distance_km=1.0):
+        self.max_speed_kmh = max_speed_kmh
+        self.min_distance_km = min_distance_km
+        self._last = {}
+
+    def __len__(self):
+        return len(self._last)
+
+    def update(self, nip, lat, lon, when):
+        last = self._last.get(nip)
+        if last is None or when >= last[2]:
+            self._last[nip] = (lat, lon, when)
+
+    def check(self, nip, lat, lon, when):
+        """Kembalikan (jarak_km, kecepatan_kmh) jika perpindahan tidak mungkin, selain itu None."""
+        last = self._last.get(nip)
+        if last is None:
+            return None
+        distance_km = haversine_m(last[0], last[1], lat, lon) / 1000
+        if distance_km < self.min_distance_km:
+            return None
+        hours = max((when - last[2]).total_seconds(), 1.0) / 3600
+        speed_kmh = distance_km / hours
+        if speed_kmh > self.max_speed_kmh:
+            return distance_km, speed_kmh
+        return None
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+
+# ====== Journal Lokal (SQLite WAL) ======
+class Journal:
+    """Journal append-only untuk data yang sudah dikonfirmasi.
+
+    Setiap baris ditulis ke sini lebih dulu, baru dikirim ke Sheets secara
+    asynchronous. Baris yang belum terkirim (shipped_at NULL) di-replay saat
+    startup; penandaan terkirim bersifat idempotent berdasarkan id.
+
+    Di mode cluster satu file journal dipakai bersama oleh semua worker (SQLite WAL).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS submissions ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created_at TEXT NOT NULL,"
+            " row TEXT NOT NULL,"
+            " shipped_at TEXT)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_submissions_unshipped"
+            " ON submissions(id) WHERE shipped_at IS NULL"
+        )
+
+    def append(self, row):
+        """Simpan satu baris dan kembalikan id journal-nya."""
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO submissions (created_at, row) VALUES (?, ?)",
+                (datetime.now().isoformat(), json.dumps(row))
+            )
+            return cur.lastrowid
+
+    def mark_shipped(self, ids):
+        if not ids:
+            return
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE submissions SET shipped_at = ? WHERE id = ? AND shipped_at IS NULL",
+                [(now, entry_id) for entry_id in ids]
+            )
+
+    def unshipped(self, upto=None):
+        """Semua baris yang belum terkirim ke Sheets (hanya id <= upto jika diisi), urut sesuai id."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, row FROM submissions WHERE shipped_at IS NULL AND id <= ? ORDER BY id",
+                (upto if upto is not None else 2 ** 63 - 1,)
+            ).fetchall()
+        return [(entry_id, json.loads(row)) for entry_id, row in rows]
+
+    def unshipped_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM submissions WHERE shipped_at IS NULL").fetchone()[0]
+
+    def last_id(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM submissions").fetchone()[0]
+
+    def rows_after(self, after_id, limit):
+        """Satu potongan (id, row) dengan id > after_id, urut sesuai id."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, row FROM submissions WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit)
+            ).fetchall()
+        return [(entry_id, json.loads(row)) for entry_id, row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,128 @@
+import json
+import math
+import mmap
+import os
+import struct
+
+
+# Header: magic, lat_min, lat_max, lon_min, lon_max, rows, cols
+MAGIC = b'IDMASK1\0'
+HEADER = struct.Struct('<8s4d2I')
+
+
+# ====== Raster Mask Wilayah ======
+class LandMask:
+    """Bitmask raster wilayah yang di-memory-map dari file hasil scripts/build_land_mask.py.
+
+    Satu bit per sel grid (1 = di dalam wilayah). Lookup hanya menghitung indeks sel
+    dan membaca satu bit, tanpa perhitungan poligon per pesan.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._bits = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.lat_min, self.lat_max, self.lon_min, self.lon_max, self.rows, self.cols = \
+            HEADER.unpack_from(self._bits, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} bukan file land mask")
+        self._row_scale = self.rows / (self.lat_max - self.lat_min)
+        self._col_scale = self.cols / (self.lon_max - self.lon_min)
+
+    def contains(self, lat, lon):
+        if not (self.lat_min <= lat < self.lat_max and self.lon_min <= lon < self.lon_max):
+            return False
+        index = int((lat - self.lat_min) * self._row_scale) * self.cols + int((lon - self.lon_min) * self._col_scale)
+        return (self._bits[HEADER.size + (index >> 3)] >> (index & 7)) & 1 == 1
+
+    def close(self):
+        self._bits.close()
+        self._file.close()
+
+
+# ====== Builder ======
+def load_geojson_rings(path):
+    """Ambil semua ring (list of (lon, lat)) dari Polygon/MultiPolygon di file GeoJSON."""
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('type') == 'FeatureCollection':
+        geometries = [feature['geometry'] for feature in data['features'] if feature.get('geometry')]
+    elif data.get('type') == 'Feature':
+        geometries = [data['geometry']]
+    else:
+        geometries = [data]
+
+    rings = []
+    for geometry in geometries:
+        if geometry['type'] == 'Polygon':
+            rings.extend(geometry['coordinates'])
+        elif geometry['type'] == 'MultiPolygon':
+            for polygon in geometry['coordinates']:
+                rings.extend(polygon)
+    return rings
+
+
+def rasterize(rings, lat_min, lat_max, lon_min, lon_max, resolution):
+    """Rasterisasi scanline (aturan even-odd) ke bytearray 0/1 per sel, baris dari selatan."""
+    rows = int(math.ceil((lat_max - lat_min) / resolution))
+    cols = int(math.ceil((lon_max - lon_min) / resolution))
+    lat_max = lat_min + rows * resolution
+    lon_max = lon_min + cols * resolution
+
+    # Kelompokkan edge per baris yang dilewatinya agar tiap baris hanya memproses edge aktif
+    edges_by_row = [[] for _ in range(rows)]
+    for ring in rings:
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+            if y1 == y2:
+                continue
+            y_low, y_high = min(y1, y2), max(y1, y2)
+            # Baris yang pusat selnya berada di [y_low, y_high)
+            first = max(0, int(math.ceil((y_low - lat_min) / resolution - 0.5)))
+            last = min(rows - 1, int(math.ceil((y_high - lat_min) / resolution - 0.5)) - 1)
+            slope = (x2 - x1) / (y2 - y1)
+            for row in range(first, last + 1):
+                edges_by_row[row].append((x1, y1, slope))
+
+    cells = bytearray(rows * cols)
+    for row, edges in enumerate(edges_by_row):
+        if not edges:
+            continue
+        y = lat_min + (row + 0.5) * resolution
+        xs = sorted(x1 + (y - y1) * slope for x1, y1, slope in edges)
+        base = row * cols
+        for x_start, x_end in zip(xs[0::2], xs[1::2]):
+            col_start = max(0, int(math.ceil((x_start - lon_min) / resolution - 0.5)))
+            col_end = min(cols, int(math.ceil((x_end - lon_min) / resolution - 0.5)))
+            if col_end > col_start:
+                cells[base + col_start:base + col_end] = b'\x01' * (col_end - col_start)
+    return cells, rows, cols, lat_max, lon_max
+
+
+def pack_bits(cells):
+    """bytearray 0/1 -> bitmask little-endian (bit i = sel i)."""
+    bit_string = cells.translate(bytes.maketrans(b'\x00\x01', b'01')).decode()
+    value = int(bit_string[::-1] or '0', 2)
+    return value.to_bytes((len(cells) + 7) // 8, 'little')
+
+
+def dilate(cells, rows, cols, radius):
+    """Perluas area sebanyak `radius` sel (untuk toleransi garis pantai/pelabuhan)."""
+    total = rows * cols
+    value = int.from_bytes(pack_bits(cells), 'little')
+    full = (1 << total) - 1
+    # Mask kolom agar geser horizontal tidak bocor ke baris sebelah
+    first_col = int(('0' * (cols - 1) + '1') * rows, 2)
+    last_col = first_col << (cols - 1)
+    for _ in range(radius):
+        value |= ((value & ~last_col) << 1) | ((value & ~first_col) >> 1)
+        value |= ((value << cols) & full) | (value >> cols)
+    bit_string = bin(value)[2:].zfill(total)[::-1]
+    return bytearray(bit_string.encode().translate(bytes.maketrans(b'01', b'\x00\x01')))
+
+
+def write_mask(path, cells, lat_min, lat_max, lon_min, lon_max, rows, cols):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, lat_min, lat_max, lon_min, lon_max, rows, cols))
+        f.write(pack_bits(cells))
+    os.replace(tmp_path, path)
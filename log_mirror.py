@@ -0,0 +1,93 @@
+import sys
+from array import array
+from datetime import date, datetime
+
+
+# Kolom Log: timestamp, nama, nip, tujuan, periode, agenda, lat, lon, gmap, foto, status
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+LAST_COLUMN = 'K'
+
+
+def normalize_nip(nip):
+    """NIP tanpa spasi; form menerima '1985 0101 ...' sehingga index dan pencarian memakai bentuk ini."""
+    return str(nip).replace(' ', '').strip()
+
+
+# ====== Mirror Kolom Log ======
+class LogMirror:
+    """Salinan kolom-kolom Log yang dibutuhkan /rekap, disimpan per kolom di memori.
+
+    Worksheet Log (dan shard bulanannya) bersifat append-only, jadi sinkronisasi
+    cukup membaca baris setelah cursor per worksheet (baris sheet berikutnya) dalam
+    potongan range A1. Index per tanggal dan per NIP menyimpan posisi baris dalam
+    array sehingga query tidak perlu memindai seluruh isi mirror.
+    """
+
+    def __init__(self, chunk_size=5000, first_row=1):
+        self.chunk_size = chunk_size
+        self.first_row = first_row
+        self.cursors = {}
+        self.synced_at = None
+        self.skipped = 0
+        self.timestamps = []
+        self.nama = []
+        self.nip = []
+        self.tujuan = []
+        self.status = []
+        self.by_date = {}
+        self.by_nip = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def next_range(self, sheet_name):
+        row = self.cursors.get(sheet_name, self.first_row)
+        return f"A{row}:{LAST_COLUMN}{row + self.chunk_size - 1}"
+
+    def ingest(self, sheet_name, values):
+        """Tambahkan baris hasil membaca next_range; kembalikan True jika masih ada potongan berikutnya."""
+        for row in values:
+            self._append(row)
+        self.cursors[sheet_name] = self.cursors.get(sheet_name, self.first_row) + len(values)
+        self.synced_at = datetime.now()
+        return len(values) >= self.chunk_size
+
+    def _append(self, row):
+        row = list(row) + [''] * (11 - len(row))
+        try:
+            # Cukup bagian tanggal dari "%Y-%m-%d %H:%M:%S"
+            day = date.fromisoformat(row[0][:10])
+        except (TypeError, ValueError):
+            # Header atau baris kosong/rusak: tetap dilewati oleh cursor
+            self.skipped += 1
+            return
+        index = len(self.timestamps)
+        nip = sys.intern(normalize_nip(row[2]))
+        self.timestamps.append(row[0])
+        self.nama.append(sys.intern(str(row[1])))
+        self.nip.append(nip)
+        self.tujuan.append(sys.intern(str(row[3])))
+        self.status.append(sys.intern(str(row[10])))
+        self.by_date.setdefault(day, array('I')).append(index)
+        self.by_nip.setdefault(nip, array('I')).append(index)
+
+    # ====== Query ======
+    def rows_on(self, day):
+        return self.by_date.get(day, ())
+
+    def rows_for_nip(self, nip, limit=None):
+        rows = self.by_nip.get(normalize_nip(nip), ())
+        return rows[-limit:] if limit else rows
+
+    def record(self, index):
+        return (self.timestamps[index], self.nama[index], self.nip[index], self.tujuan[index], self.status[index])
+
+    def summary_on(self, day):
+        """Jumlah check-in/check-out dan status terakhir per NIP pada satu tanggal."""
+        counts = {}
+        latest = {}
+        for index in self.rows_on(day):
+            status = self.status[index]
+            counts[status] = counts.get(status, 0) + 1
+            latest[self.nip[index]] = index
+        return counts, latest
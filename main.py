@@ -1,11 +1,36 @@
+import time
+PROCESS_STARTED = time.perf_counter()  # acuan waktu startup, diambil sebelum import library lain
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler, ContextTypes, CallbackQueryHandler
+from telegram.helpers import escape_markdown
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler, ContextTypes, CallbackQueryHandler, PicklePersistence, PersistenceInput, TypeHandler
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, timedelta
 import calendar
+import asyncio
+import functools
 import os, json
 
+from sheets import MonthlyShards, SheetExecutor, SheetHandle
+from cluster import ClusterStore, SharedPersistence, SharedTokenBucket
+from file_cache import FilePathCache
+from geo import GeoGuard, TravelIndex
+from journal import Journal
+from land_mask import LandMask
+from log_mirror import LogMirror
+from metrics import MetricsServer, Registry, timed_handler
+from photo_hash import PhotoHashIndex
+from profiles import ProfileStore
+from roster import Roster, read_roster_csv
+from notifier import NotificationDispatcher
+from pairing import PairingEngine, format_duration
+from sessions import SessionStore
+from storage import MemoryStorage, SheetsStorage, SQLiteStorage, TeeStorage
+from update_processor import PerUserUpdateProcessor
+from validation import Validator, register_check
+from write_queue import SheetWriteQueue
+
 # ====== Konstanta State Form ======
 (NAMA, NIP, TUJUAN, PERIODE, PERIODE_START, PERIODE_END, AGENDA, LOKASI, FOTO, KONFIRMASI, STATUS) = range(11)
 
@@ -14,24 +39,242 @@ TELEGRAM_TOKEN = 'TELEGRAM_TOKEN'
 SPREADSHEET_NAME = 'MonitoringDinas'
 SHEET_NAME = 'Log'
 
+# ====== Mode Serving ======
+# BOT_MODE=webhook untuk menerima update via webhook, selain itu polling
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL') or None  # URL publik; default dibentuk dari listen/port/path
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', os.environ.get('PORT', '8443')))
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET') or None
+# Jumlah update yang diproses bersamaan (update dari user yang sama tetap berurutan)
+UPDATE_CONCURRENCY = int(os.environ.get('UPDATE_CONCURRENCY', '64'))
+
+# ====== Mode Cluster ======
+# Diisi oleh cluster.py untuk setiap worker: state percakapan, draft session dan rate limit
+# notifikasi group disimpan di store SQLite yang dipakai bersama oleh semua worker
+CLUSTER_STORE_PATH = os.environ.get('CLUSTER_STORE_PATH') or None
+CLUSTER_WORKER = int(os.environ.get('CLUSTER_WORKER', '0'))
+CLUSTER_WORKERS = int(os.environ.get('CLUSTER_WORKERS', '1'))
+# Journal dipakai bersama: hanya worker 0 yang me-replay baris lama (id <= batas dari front)
+CLUSTER_REPLAY_UPTO = int(os.environ['CLUSTER_REPLAY_UPTO']) if os.environ.get('CLUSTER_REPLAY_UPTO') else None
+
+cluster_store = ClusterStore(CLUSTER_STORE_PATH) if CLUSTER_STORE_PATH else None
+
+# ====== Metrics (Prometheus) ======
+# Endpoint teks Prometheus di METRICS_HOST:METRICS_PORT/metrics (METRICS_PORT=0 untuk mematikan)
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '9464'))
+
+metrics = Registry()
+handler_latency = metrics.histogram('bot_handler_seconds', 'Durasi handler per langkah form', ('handler',))
+sheets_latency = metrics.histogram('bot_sheets_call_seconds', 'Durasi panggilan Google Sheets', ('outcome',))
+sheets_errors = metrics.counter('bot_sheets_errors_total', 'Panggilan Google Sheets yang gagal', ('error',))
+notify_latency = metrics.histogram(
+    'bot_group_notification_seconds', 'Waktu dari submit sampai notifikasi group selesai', ('outcome',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+metrics_server = MetricsServer(metrics, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+
+def observe_sheets_call(seconds, outcome):
+    sheets_latency.observe(seconds, outcome)
+    if outcome != 'ok':
+        sheets_errors.inc(outcome)
+
 # ====== Group Telegram Config ======
 # Ganti dengan Chat ID group Anda (contoh: -1001234567890)
 # Untuk mendapatkan Chat ID: tambahkan bot ke group, lalu kirim pesan dan cek di @userinfobot
 GROUP_CHAT_ID = '-1002527924058'  # Ganti dengan Chat ID group Anda
 
+# File data bawaan (rule validasi, blacklist, land mask) dicari relatif terhadap modul ini,
+# bukan working directory, agar bot dan scripts/ bisa dijalankan dari direktori mana pun
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
 # ====== Setup Google Sheets ======
+# Authorize dilakukan saat Sheets pertama kali dipakai (warmup di background), bukan saat import
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds_json = json.loads(os.environ['GOOGLE_CREDS_JSON'])
-creds = ServiceAccountCredentials.from_json_keyfile_name("creds__json", scope)
-client = gspread.authorize(creds)
 
-# Lazy loading untuk sheet - hanya load saat dibutuhkan
-def get_sheet():
+# Semua I/O gspread berjalan di thread pool terbatas, di luar event loop
+SHEETS_MAX_WORKERS = int(os.environ.get('SHEETS_MAX_WORKERS', '4'))
+SHEETS_MAX_CONCURRENCY = int(os.environ.get('SHEETS_MAX_CONCURRENCY', str(SHEETS_MAX_WORKERS)))
+SHEETS_CALL_TIMEOUT = float(os.environ.get('SHEETS_CALL_TIMEOUT', '30'))
+# Timeout per request HTTP; satu panggilan bisa beberapa request (mis. buat shard + index + append)
+SHEETS_HTTP_TIMEOUT = float(os.environ.get('SHEETS_HTTP_TIMEOUT', '10'))
+
+def authorize_client():
+    # Kredensial langsung dari JSON di env, tanpa file sementara
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(os.environ['GOOGLE_CREDS_JSON']), scope)
+    client = gspread.authorize(creds)
+    # Timeout HTTP agar thread yang macet ikut dilepas, bukan hanya coroutine-nya
+    client.set_timeout(SHEETS_HTTP_TIMEOUT)
+    return client
+
+sheets_executor = SheetExecutor(
+    max_workers=SHEETS_MAX_WORKERS,
+    max_concurrency=SHEETS_MAX_CONCURRENCY,
+    timeout=SHEETS_CALL_TIMEOUT,
+    observe=observe_sheets_call
+)
+
+# Worksheet di-resolve sekali lalu dipakai bersama oleh semua handler
+sheet_handle = SheetHandle(authorize_client, SPREADSHEET_NAME, SHEET_NAME)
+
+# ====== Worksheet Log per Bulan ======
+# LOG_SHARDING=monthly: baris ditulis ke Log_YYYY_MM (dibuat otomatis, dicatat di LOG_INDEX_SHEET);
+# worksheet Log lama tetap dibaca untuk data sebelum sharding. LOG_SHARDING=off: semua ke Log.
+LOG_SHARDING = os.environ.get('LOG_SHARDING', 'monthly')
+LOG_INDEX_SHEET = os.environ.get('LOG_INDEX_SHEET', 'Log_Index')
+LOG_HEADER = ['Timestamp', 'Nama', 'NIP/NRP', 'Tujuan', 'Periode', 'Agenda', 'Latitude', 'Longitude', 'Google Maps', 'Foto', 'Status']
+
+log_shards = MonthlyShards(sheet_handle, SHEET_NAME, LOG_INDEX_SHEET, LOG_HEADER) if LOG_SHARDING == 'monthly' else None
+
+# ====== Storage Backend ======
+# STORAGE_BACKEND=sheets (default) | sqlite | memory | tee. Mode tee menulis langsung ke store lokal
+# (STORAGE_TEE_LOCAL=sqlite|memory) yang juga melayani /rekap, lalu menyalin ke Sheets di background.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sheets')
+STORAGE_TEE_LOCAL = os.environ.get('STORAGE_TEE_LOCAL', 'sqlite')
+STORAGE_PATH = os.environ.get('STORAGE_PATH', 'storage.db')
+
+def open_storage(kind):
+    if kind == 'sheets':
+        return SheetsStorage(sheet_handle, SHEET_NAME, log_shards)
+    if kind == 'sqlite':
+        return SQLiteStorage(STORAGE_PATH)
+    if kind == 'memory':
+        if cluster_store is not None:
+            raise ValueError("STORAGE_BACKEND memory tidak bisa dipakai di mode cluster (gunakan sqlite)")
+        return MemoryStorage()
+    if kind == 'tee':
+        return TeeStorage(open_storage(STORAGE_TEE_LOCAL), open_storage('sheets'))
+    raise ValueError(f"STORAGE_BACKEND tidak dikenal: {kind}")
+
+storage = open_storage(STORAGE_BACKEND)
+# Backend tujuan write-behind queue: Sheets pada mode tee, selain itu backend itu sendiri
+shipping_storage = getattr(storage, 'mirror', storage)
+# Store memori kosong setelah restart dan diisi ulang dari journal di background (history_warmup)
+memory_store = getattr(storage, 'local', storage)
+if not isinstance(memory_store, MemoryStorage):
+    memory_store = None
+
+async def run_storage(backend, fn, *args, settle=False):
+    """Panggilan ke Sheets lewat SheetExecutor; store lokal cukup dipanggil langsung."""
+    if backend.remote:
+        return await sheets_executor.run(fn, *args, settle=settle)
+    return fn(*args)
+
+# ====== Journal Lokal ======
+# Data yang dikonfirmasi ditulis ke journal SQLite dulu agar tidak hilang saat Sheets down/restart
+JOURNAL_PATH = os.environ.get('JOURNAL_PATH', 'journal.db')
+journal = Journal(JOURNAL_PATH)
+
+# ====== Deteksi Perjalanan Mustahil ======
+# Lokasi terakhir per NIP disimpan di memori dan dibangun dari journal di background setelah startup
+MAX_TRAVEL_SPEED_KMH = float(os.environ.get('MAX_TRAVEL_SPEED_KMH', '1000'))
+travel_index = TravelIndex(max_speed_kmh=MAX_TRAVEL_SPEED_KMH)
+
+def read_journal_chunk(after_id, upto, chunk_size=5000):
+    """Satu potongan journal (id <= upto) beserta lokasinya yang sudah di-parse (blocking)."""
+    entries = [entry for entry in journal.rows_after(after_id, chunk_size) if entry[0] <= upto]
+    locations = [
+        (row[2], float(row[6]), float(row[7]), datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S"))
+        for _, row in entries
+    ]
+    return entries, locations
+
+# ====== Write-behind Queue ======
+# Baris dari journal dikumpulkan lalu dikirim sekaligus via append_rows
+SHEET_BATCH_SIZE = int(os.environ.get('SHEET_BATCH_SIZE', '50'))
+SHEET_BATCH_DELAY = float(os.environ.get('SHEET_BATCH_DELAY', '2.0'))
+
+async def flush_rows(entries):
+    # Satu append per bulan (satu shard di Sheets); bulan yang sudah terkirim dikeluarkan dari batch
+    # agar tidak terkirim dua kali jika bulan berikutnya gagal dan batch dicoba ulang
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry[1][0][:7], []).append(entry)
+    for group in groups.values():
+        rows = [row for _, row in group]
+        # settle: append yang melewati timeout ditunggu hasilnya, bukan dicoba ulang (baris ganda)
+        await run_storage(shipping_storage, shipping_storage.append_rows, rows, settle=True)
+        shipped = {entry_id for entry_id, _ in group}
+        journal.mark_shipped(list(shipped))
+        entries[:] = [entry for entry in entries if entry[0] not in shipped]
+
+sheet_writer = SheetWriteQueue(flush_rows, max_batch=SHEET_BATCH_SIZE, max_delay=SHEET_BATCH_DELAY)
+
+# ====== Warmup Google Sheets ======
+# Bot langsung melayani update; authorize + resolve worksheet berjalan di background dengan retry,
+# jadi Google yang tidak bisa dihubungi tidak menggagalkan startup
+SHEETS_WARMUP_RETRY_MAX = float(os.environ.get('SHEETS_WARMUP_RETRY_MAX', '300'))
+
+sheets_ready = asyncio.Event()
+first_update_at = None
+
+def resolve_sheets():
+    """Authorize lalu resolve worksheet yang dipakai untuk menulis (blocking)."""
+    if log_shards is None:
+        sheet_handle.get(SHEET_NAME)
+        return
+    current = log_shards.shards().get(datetime.now().strftime('%Y-%m'))
+    if current is not None:
+        sheet_handle.get(current)
+
+async def sheets_warmup():
+    delay = 1.0
+    while True:
+        try:
+            await sheets_executor.run(resolve_sheets)
+            break
+        except Exception as e:
+            print(f"Error warming up Google Sheets (retry in {delay:g}s): {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, SHEETS_WARMUP_RETRY_MAX)
+    sheets_ready.set()
+    print(f"Google Sheets ready {time.perf_counter() - PROCESS_STARTED:.2f}s after process start")
+
+# ====== Warmup Riwayat dari Journal ======
+# Index perjalanan, index foto dan store memori dibangun dari riwayat di background, jadi waktu
+# startup tidak bertambah seiring journal. Selama warmup, validasi perjalanan/foto hanya mengenal
+# laporan baru dan /rekap pada store memori menunggu sampai riwayat selesai dimuat.
+history_ready = asyncio.Event()
+
+async def history_warmup(upto):
+    """Muat riwayat journal sampai id `upto` (baris sesudahnya sudah ditangani handler)."""
+    started = time.perf_counter()
     try:
-        return client.open(SPREADSHEET_NAME).worksheet(SHEET_NAME)
+        history = []
+        after_id = 0
+        while True:
+            entries, locations = await asyncio.to_thread(read_journal_chunk, after_id, upto)
+            if not entries:
+                break
+            # update() dijalankan di event loop agar tidak balapan dengan handler
+            for location in locations:
+                travel_index.update(*location)
+            if memory_store is not None:
+                history.extend(row for _, row in entries)
+            after_id = entries[-1][0]
+        print(f"Travel index built for {len(travel_index)} NIPs")
+
+        await asyncio.to_thread(photo_index.load)
+        if not photo_index.enabled:
+            print("⚠️ Pillow tidak terpasang, deteksi foto mirip hanya berdasarkan file_unique_id")
+        print(f"Photo hash index loaded with {len(photo_index)} photos")
+
+        if memory_store is not None:
+            memory_store.prepend_rows(history)
+            print(f"Loaded {len(memory_store)} rows into memory storage")
     except Exception as e:
-        print(f"Error connecting to Google Sheets: {e}")
-        return None
+        print(f"Error loading history from journal: {e}")
+    history_ready.set()
+    print(f"History loaded in {time.perf_counter() - started:.2f}s "
+          f"({time.perf_counter() - PROCESS_STARTED:.2f}s after process start)")
+
+async def note_first_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global first_update_at
+    if first_update_at is None:
+        first_update_at = time.perf_counter()
+        print(f"First update received {first_update_at - PROCESS_STARTED:.2f}s after process start")
 
 # ====== Function to get group chat ID (untuk debugging) ======
 async def get_chat_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -45,43 +288,394 @@ async def get_chat_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 # ====== Function to send notification to group ======
-async def send_group_notification(context: ContextTypes.DEFAULT_TYPE, user_data):
-    try:
-        now = datetime.now()
-        gmap = f"https://www.google.com/maps?q={user_data['lat']},{user_data['lon']}"
-        
-        status_icon = "🚀" if user_data['status'] == 'Check-in' else "🏁"
-        notification_text = (
-            f"📋 *LAPORAN {user_data['status'].upper()} DINAS*\n\n"
-            f"{status_icon} **Status:** {user_data['status']}\n"
-            f"📅 **Tanggal:** {now.strftime('%d/%m/%Y %H:%M')}\n"
-            f"👤 **Nama:** {user_data['nama']}\n"
-            f"🆔 **NIP/NRP:** {user_data['nip']}\n"
-            f"📍 **Tujuan:** {user_data['tujuan']}\n"
-            f"📅 **Periode:** {user_data['periode']}\n"
-            f"📝 **Agenda:** {user_data['agenda']}\n"
-            f"🌍 **Lokasi:** [Lihat di Google Maps]({gmap})\n\n"
-            "✅ Data telah tercatat dalam sistem monitoring."
-        )
-        
-        # Kirim foto dengan caption laporan ke group
-        await context.bot.send_photo(
+# Notifikasi dikirim oleh dispatcher di background dengan rate limit per group
+NOTIFY_WORKERS = int(os.environ.get('NOTIFY_WORKERS', '4'))
+NOTIFY_RATE_PER_MINUTE = float(os.environ.get('NOTIFY_RATE_PER_MINUTE', '20'))  # batas Telegram untuk group
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get('NOTIFY_MAX_ATTEMPTS', '5'))
+
+notifier = NotificationDispatcher(
+    workers=NOTIFY_WORKERS,
+    rate_per_minute=NOTIFY_RATE_PER_MINUTE,
+    max_attempts=NOTIFY_MAX_ATTEMPTS,
+    bucket_factory=(
+        (lambda chat_id, rate, capacity: SharedTokenBucket(cluster_store, f"notify:{chat_id}", rate, capacity))
+        if cluster_store is not None else None
+    )
+)
+
+def send_group_notification(bot, user_data, now, on_done=None):
+    gmap = f"https://www.google.com/maps?q={user_data.lat},{user_data.lon}"
+    
+    status_icon = "🚀" if user_data.status == 'Check-in' else "🏁"
+    notification_text = (
+        f"📋 *LAPORAN {user_data.status.upper()} DINAS*\n\n"
+        f"{status_icon} **Status:** {user_data.status}\n"
+        f"📅 **Tanggal:** {now.strftime('%d/%m/%Y %H:%M')}\n"
+        f"👤 **Nama:** {user_data.nama}\n"
+        f"🆔 **NIP/NRP:** {user_data.nip}\n"
+        f"📍 **Tujuan:** {user_data.tujuan}\n"
+        f"📅 **Periode:** {user_data.periode}\n"
+        f"📝 **Agenda:** {user_data.agenda}\n"
+        f"🌍 **Lokasi:** [Lihat di Google Maps]({gmap})\n\n"
+        "✅ Data telah tercatat dalam sistem monitoring."
+    )
+    
+    # Latency dicatat dari submit (termasuk antrian & rate limit) sampai selesai
+    submitted = time.perf_counter()
+    async def record_latency(delivered):
+        notify_latency.observe(time.perf_counter() - submitted, 'sent' if delivered else 'failed')
+        if on_done is not None:
+            await on_done(delivered)
+    
+    # Kirim foto dengan caption laporan ke group (lewat antrian dispatcher)
+    notifier.submit(
+        GROUP_CHAT_ID,
+        lambda: bot.send_photo(
             chat_id=GROUP_CHAT_ID,
-            photo=user_data['foto_file_id'],
+            photo=user_data.foto_file_id,
             caption=notification_text,
             parse_mode='Markdown'
-        )
-        
-        return True
-    except Exception as e:
-        print(f"Error sending group notification: {e}")
-        print(f"Group Chat ID yang digunakan: {GROUP_CHAT_ID}")
-        return False
+        ),
+        on_done=record_latency
+    )
 
 # ====== Data Sementara per User ======
-user_data_dict = {}
+# Draft form per user: dibatasi ukurannya, draft yang ditinggal dihapus setelah TTL,
+# dan disimpan berkala ke disk agar form yang sedang diisi bertahan saat restart
+# (perubahan sejak snapshot terakhir hilang jika proses mati mendadak)
+SESSION_MAX = int(os.environ.get('SESSION_MAX', '10000'))
+SESSION_TTL = int(os.environ.get('SESSION_TTL', str(6 * 3600)))
+SESSION_SNAPSHOT_PATH = os.environ.get('SESSION_SNAPSHOT_PATH', 'sessions.json')
+SESSION_SNAPSHOT_INTERVAL = int(os.environ.get('SESSION_SNAPSHOT_INTERVAL', '60'))
+
+sessions = SessionStore(max_sessions=SESSION_MAX, ttl=SESSION_TTL, snapshot_path=SESSION_SNAPSHOT_PATH or None)
+# State ConversationHandler ikut disimpan agar draft yang dipulihkan tetap di langkah yang sama
+CONVERSATION_STATE_PATH = os.environ.get('CONVERSATION_STATE_PATH', 'conversations.pickle')
+# Session & state percakapan disimpan ke snapshot lokal, atau ke store bersama pada mode cluster
+SESSIONS_PERSISTENT = bool(sessions.snapshot_path) or cluster_store is not None
+
+def save_sessions():
+    if cluster_store is not None:
+        cluster_store.save_sessions(CLUSTER_WORKER, sessions.dump())
+    else:
+        sessions.save_snapshot()
+
+def load_sessions():
+    if cluster_store is not None:
+        return sessions.restore(cluster_store.load_sessions(CLUSTER_WORKER, CLUSTER_WORKERS))
+    return sessions.load_snapshot()
+
+async def session_maintenance():
+    while True:
+        await asyncio.sleep(SESSION_SNAPSHOT_INTERVAL)
+        sessions.evict_expired()
+        try:
+            save_sessions()
+        except Exception as e:
+            print(f"Error saving session snapshot: {e}")
+
+async def reply_session_expired(update: Update):
+    await update.effective_message.reply_text(
+        "⌛ *Sesi Anda telah berakhir.*\n\n"
+        "Data form sebelumnya sudah dihapus. Ketik /start untuk mulai lagi.",
+        parse_mode='Markdown'
+    )
+    return ConversationHandler.END
+
+# ====== Validasi Lokasi (Spatial Index) ======
+# Blacklist titik spoofing dan geofence tujuan dimuat dari file lokal dan dimuat ulang saat file berubah
+SPOOF_BLACKLIST_PATH = os.environ.get('SPOOF_BLACKLIST_PATH', os.path.join(DATA_DIR, 'spoof_blacklist.csv'))
+GEOFENCE_PATH = os.environ.get('GEOFENCE_PATH', os.path.join(DATA_DIR, 'geofences.csv'))  # kolom: name,lat,lon,radius_m
+GEOFENCE_REQUIRED = os.environ.get('GEOFENCE_REQUIRED', '0') == '1'
+GEO_RELOAD_INTERVAL = int(os.environ.get('GEO_RELOAD_INTERVAL', '60'))
+
+geo_guard = GeoGuard(SPOOF_BLACKLIST_PATH, GEOFENCE_PATH)
+
+# Raster bitmask wilayah Indonesia, dibangun dengan scripts/build_land_mask.py (tidak ikut di repo);
+# tanpa file ini pengecekan wilayah memakai bounding box kasar dan startup mencetak peringatan
+LAND_MASK_PATH = os.environ.get('LAND_MASK_PATH', os.path.join(DATA_DIR, 'indonesia_mask.bin'))
+land_mask = LandMask(LAND_MASK_PATH) if os.path.exists(LAND_MASK_PATH) else None
+
+def is_in_indonesia(lat, lon):
+    if land_mask is not None:
+        return land_mask.contains(lat, lon)
+    # Fallback: Latitude -11 to 6, Longitude 95 to 141
+    return -11 <= lat <= 6 and 95 <= lon <= 141
+
+async def geo_reload_loop():
+    while True:
+        await asyncio.sleep(GEO_RELOAD_INTERVAL)
+        try:
+            counts = geo_guard.reload_if_changed()
+            if counts:
+                print(f"Reloaded spatial index: {counts[0]} blacklisted points, {counts[1]} geofences")
+        except Exception as e:
+            print(f"Error reloading spatial index: {e}")
+
+# ====== Deteksi Foto Berulang ======
+# Hash perseptual foto yang dikonfirmasi disimpan di multi-index hash (persisten di disk)
+PHOTO_HASH_PATH = os.environ.get('PHOTO_HASH_PATH', 'photo_hashes.tsv')
+PHOTO_HASH_MAX_DISTANCE = int(os.environ.get('PHOTO_HASH_MAX_DISTANCE', '6'))
+PHOTO_HASH_WORKERS = int(os.environ.get('PHOTO_HASH_WORKERS', '2'))
+
+photo_index = PhotoHashIndex(
+    PHOTO_HASH_PATH, max_distance=PHOTO_HASH_MAX_DISTANCE, workers=PHOTO_HASH_WORKERS, shared=cluster_store is not None
+)
+
+# ====== Resolusi File Foto di Background ======
+# getFile tidak lagi ditunggu di langkah FOTO; hasilnya di-cache per file_id
+FILE_PATH_TTL = int(os.environ.get('FILE_PATH_TTL', '3300'))
+PHOTO_RESOLVE_TIMEOUT = float(os.environ.get('PHOTO_RESOLVE_TIMEOUT', '20'))
+
+file_paths = FilePathCache(ttl=FILE_PATH_TTL)
+
+def reused_photo_text(reused):
+    return (
+        "❌ *Foto ini sudah pernah digunakan!*\n\n"
+        f"🕒 Foto yang sama/mirip sudah dikirim pada {reused[1]}.\n\n"
+        "📸 Silakan ambil foto baru langsung dari kamera:"
+    )
+
+async def resolve_photo(bot, file_id):
+    """Kembalikan (file_path, hash) untuk foto; file_path diambil dari cache jika ada."""
+    file_path = file_paths.get(file_id)
+    if file_path is not None and not photo_index.enabled:
+        return file_path, None
+    
+    file = await bot.get_file(file_id)
+    file_paths.put(file_id, file.file_path)
+    foto_hash = None
+    if photo_index.enabled:
+        image_bytes = await file.download_as_bytearray()
+        foto_hash = await photo_index.hash_image(bytes(image_bytes))
+    return file.file_path, foto_hash
+
+async def photo_for_save(bot, session):
+    task, session.foto_task = session.foto_task, None
+    if task is not None:
+        try:
+            return await asyncio.wait_for(task, PHOTO_RESOLVE_TIMEOUT)
+        except Exception as e:
+            print(f"Error resolving photo in background: {e}")
+    # Task tidak ada (mis. setelah restart) atau gagal: resolve ulang sekarang
+    return await asyncio.wait_for(resolve_photo(bot, session.foto_file_id), PHOTO_RESOLVE_TIMEOUT)
+
+# ====== Roster Pegawai ======
+# Roster dimuat dari CSV lokal (ROSTER_CSV) atau worksheet Roster, lalu di-refresh berkala
+ROSTER_SHEET_NAME = os.environ.get('ROSTER_SHEET_NAME', 'Roster')
+ROSTER_CSV = os.environ.get('ROSTER_CSV')
+ROSTER_REFRESH_INTERVAL = int(os.environ.get('ROSTER_REFRESH_INTERVAL', '600'))
+
+roster = Roster()
+
+async def load_roster():
+    try:
+        if ROSTER_CSV:
+            records = await asyncio.to_thread(read_roster_csv, ROSTER_CSV)
+        else:
+            records = await sheets_executor.run(sheet_handle.call, lambda sheet: sheet.get_all_records(), ROSTER_SHEET_NAME)
+        print(f"Roster loaded: {roster.replace(records)} employees")
+    except Exception as e:
+        print(f"Error loading roster: {e}")
+
+async def roster_refresh_loop():
+    if not ROSTER_CSV:
+        await sheets_ready.wait()
+    while True:
+        await load_roster()
+        await asyncio.sleep(ROSTER_REFRESH_INTERVAL)
+
+def prefill_from_roster(session, user_id):
+    """Isi nama & NIP dari roster untuk user yang dikenal; kembalikan teks lanjutan atau None."""
+    entry = roster.lookup_user(user_id)
+    if entry is None:
+        return None
+    session.nama = entry.nama
+    session.nip = entry.nip
+    return (
+        f"👤 *Nama:* {entry.nama}\n"
+        f"🆔 *NIP/NRP:* {entry.nip}\n\n"
+        "Masukkan *Lokasi Tujuan Dinas*:"
+    )
+
+# ====== Profil Perjalanan Terakhir ======
+# Data perjalanan dari submission terakhir per user, untuk tombol "ulangi perjalanan yang sama"
+PROFILE_PATH = os.environ.get('PROFILE_PATH', 'profiles.json')
+PROFILE_SAVE_INTERVAL = int(os.environ.get('PROFILE_SAVE_INTERVAL', '30'))
+
+profiles = ProfileStore(PROFILE_PATH or None)
+
+async def profile_save_loop():
+    while True:
+        await asyncio.sleep(PROFILE_SAVE_INTERVAL)
+        try:
+            await asyncio.to_thread(profiles.save_if_dirty)
+        except Exception as e:
+            print(f"Error saving profiles: {e}")
+
+def repeat_trip_buttons(user_id):
+    """Baris tombol ulangi perjalanan jika user punya perjalanan yang masih berlaku."""
+    profile = profiles.active_trip(user_id)
+    if profile is None:
+        return []
+    return [
+        [InlineKeyboardButton(f"🔁 Check-in: {profile.tujuan}", callback_data='repeat_checkin')],
+        [InlineKeyboardButton(f"🔁 Check-out: {profile.tujuan}", callback_data='repeat_checkout')]
+    ]
+
+def main_menu_keyboard(user_id):
+    keyboard = repeat_trip_buttons(user_id) + [
+        [InlineKeyboardButton("🚀 Check-in", callback_data='start_checkin')],
+        [InlineKeyboardButton("🏁 Check-out", callback_data='start_checkout')],
+        [InlineKeyboardButton("🔄 Reset Data", callback_data='reset_data')],
+        [InlineKeyboardButton("ℹ️ Info Bot", callback_data='info_bot')]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+# ====== Rekap dari Mirror Log ======
+# /rekap dijawab dari mirror kolom Log di memori; hanya baris baru yang dibaca dari Sheets
+REKAP_SYNC_INTERVAL = int(os.environ.get('REKAP_SYNC_INTERVAL', '60'))
+REKAP_SYNC_CHUNK = int(os.environ.get('REKAP_SYNC_CHUNK', '5000'))
+REKAP_MAX_LINES = int(os.environ.get('REKAP_MAX_LINES', '40'))
+# Daftar Telegram user id yang boleh memakai /rekap dan perintah admin lain (kosong = hanya admin group)
+REKAP_ALLOWED_USERS = {int(x) for x in os.environ.get('REKAP_ALLOWED_USERS', '').split(',') if x.strip()}
+REKAP_ADMIN_CACHE_SECONDS = int(os.environ.get('REKAP_ADMIN_CACHE_SECONDS', '300'))
+rekap_admin_cache = {}  # user id -> (is_admin, waktu cek)
+
+log_mirror = LogMirror(chunk_size=REKAP_SYNC_CHUNK)
+log_mirror_lock = asyncio.Lock()
+# Pasangan check-in/check-out dihitung incremental dari baris mirror yang baru masuk
+pairing = PairingEngine()
+log_mirror_cursor = None  # cursor stream untuk backend non-Sheets
+
+async def log_sheets_to_sync():
+    """Worksheet yang perlu dibaca: Log lama sekali saja, lalu shard bulan lalu & bulan ini
+    (shard yang lebih lama tidak bertambah lagi, jadi cukup dibaca sekali)."""
+    if log_shards is None:
+        return [SHEET_NAME]
+    shards = await sheets_executor.run(log_shards.refresh)
+    previous_month = (datetime.now().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    names = [SHEET_NAME] if SHEET_NAME not in log_mirror.cursors else []
+    for month, name in sorted(shards.items()):
+        if month >= previous_month or name not in log_mirror.cursors:
+            names.append(name)
+    return names
+
+async def sync_log_mirror():
+    global log_mirror_cursor
+    async with log_mirror_lock:
+        if not storage.remote:
+            if memory_store is not None and not history_ready.is_set():
+                return  # cursor berupa posisi baris: tunggu riwayat disisipkan di depan
+            # Store lokal: cukup lanjutkan stream dari cursor terakhir
+            for cursor, rows in storage.stream(REKAP_SYNC_CHUNK, start=log_mirror_cursor):
+                log_mirror.ingest(STORAGE_BACKEND, rows)
+                log_mirror_cursor = cursor
+            pairing.process(log_mirror)
+            return
+        for sheet_name in await log_sheets_to_sync():
+            more = True
+            while more:
+                range_name = log_mirror.next_range(sheet_name)
+                try:
+                    values = await sheets_executor.run(sheet_handle.call, lambda sheet: sheet.get(range_name), sheet_name)
+                except gspread.exceptions.WorksheetNotFound:
+                    values = []  # belum ada worksheet Log lama
+                more = log_mirror.ingest(sheet_name, values)
+        pairing.process(log_mirror)
+
+async def log_mirror_loop():
+    if storage.remote:
+        await sheets_ready.wait()
+    while True:
+        try:
+            await sync_log_mirror()
+        except Exception as e:
+            print(f"Error syncing log mirror: {e}")
+        await asyncio.sleep(REKAP_SYNC_INTERVAL)
+
+def parse_rekap_date(text):
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+def format_rekap_line(record, with_date=False):
+    timestamp, nama, nip, tujuan, status = record
+    status_icon = "🚀" if status == 'Check-in' else "🏁"
+    waktu = timestamp[:16] if with_date else timestamp[11:16]
+    # Teks bebas dari pengguna di-escape agar satu '_' atau '*' tidak membuat seluruh pesan ditolak
+    return f"{status_icon} {waktu} {escape_markdown(nama)} ({escape_markdown(nip)}) - {escape_markdown(tujuan)}"
+
+# ====== Validasi Form (Rule Deklaratif) ======
+# Rule per langkah form (ambang batas, urutan, pesan) dimuat dari file JSON, dikompilasi sekali
+# menjadi pipeline predicate dan dimuat ulang saat file berubah, tanpa redeploy
+VALIDATION_RULES_PATH = os.environ.get('VALIDATION_RULES_PATH', os.path.join(DATA_DIR, 'validation_rules.json'))
+VALIDATION_RELOAD_INTERVAL = int(os.environ.get('VALIDATION_RELOAD_INTERVAL', '60'))
+
+validator = Validator(VALIDATION_RULES_PATH)
+
+# Check yang membutuhkan state bot (roster, spatial index, travel index, index foto)
+@register_check('in_roster')
+def in_roster_check():
+    def predicate(fields):
+        return {} if len(roster) and roster.lookup_nip(fields['text']) is None else None
+    return predicate
+
+@register_check('not_blacklisted')
+def not_blacklisted_check():
+    def predicate(fields):
+        return {} if geo_guard.is_blacklisted(fields['lat'], fields['lon']) else None
+    return predicate
+
+@register_check('in_indonesia')
+def in_indonesia_check():
+    def predicate(fields):
+        return None if is_in_indonesia(fields['lat'], fields['lon']) else {}
+    return predicate
+
+@register_check('plausible_travel')
+def plausible_travel_check():
+    def predicate(fields):
+        travel = travel_index.check(fields['nip'], fields['lat'], fields['lon'], datetime.now())
+        if travel:
+            return {'distance_km': travel[0], 'speed_kmh': travel[1]}
+        return None
+    return predicate
+
+@register_check('in_geofence')
+def in_geofence_check():
+    def predicate(fields):
+        if GEOFENCE_REQUIRED and geo_guard.geofences.count and geo_guard.geofence_for(fields['lat'], fields['lon']) is None:
+            return {}
+        return None
+    return predicate
+
+@register_check('not_reused_photo')
+def not_reused_photo_check():
+    def predicate(fields):
+        reused = photo_index.find_by_unique_id(fields['unique_id'])
+        return {'reused_at': reused[1]} if reused else None
+    return predicate
+
+async def validation_reload_loop():
+    while True:
+        await asyncio.sleep(VALIDATION_RELOAD_INTERVAL)
+        try:
+            count = validator.reload_if_changed()
+            if count is not None:
+                print(f"Reloaded {count} validation rules")
+        except Exception as e:
+            print(f"Error reloading validation rules: {e}")
 
 # ====== Calendar Helper Functions ======
+# Keyboard kalender hanya bergantung pada (year, month) dan InlineKeyboardMarkup bersifat
+# immutable, jadi hasilnya di-cache dan dipakai ulang untuk semua user
+CALENDAR_CACHE_SIZE = int(os.environ.get('CALENDAR_CACHE_SIZE', '64'))
+
+@functools.lru_cache(maxsize=CALENDAR_CACHE_SIZE)
 def create_calendar_keyboard(year, month):
     keyboard = []
     
@@ -118,15 +712,21 @@ def create_calendar_keyboard(year, month):
     
     return InlineKeyboardMarkup(keyboard)
 
+def warm_calendar_cache():
+    # Siapkan kalender bulan lalu, bulan ini dan bulan depan saat startup
+    now = datetime.now()
+    for offset in (-1, 0, 1):
+        month_index = now.year * 12 + (now.month - 1) + offset
+        create_calendar_keyboard(month_index // 12, month_index % 12 + 1)
+
+@functools.lru_cache(maxsize=512)
+def parse_calendar_callback(data):
+    """'date_2026_10_17' -> (2026, 10, 17), 'cal_2026_11' -> (2026, 11)"""
+    return tuple(map(int, data.split("_")[1:]))
+
 # ====== Langkah per Form ======
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-      keyboard = [
-          [InlineKeyboardButton("🚀 Check-in", callback_data='start_checkin')],
-          [InlineKeyboardButton("🏁 Check-out", callback_data='start_checkout')],
-          [InlineKeyboardButton("🔄 Reset Data", callback_data='reset_data')],
-          [InlineKeyboardButton("ℹ️ Info Bot", callback_data='info_bot')]
-      ]
-      reply_markup = InlineKeyboardMarkup(keyboard)
+      reply_markup = main_menu_keyboard(update.effective_user.id)
       
       await update.message.reply_text(
           "🤖 *Bot Monitoring Dinas*\n\n"
@@ -137,94 +737,45 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
       return STATUS
 
 async def get_nama(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id not in user_data_dict:
-        user_data_dict[user_id] = {}
+    session = sessions.get(update.effective_user.id)
+    if session is None:
+        return await reply_session_expired(update)
     
     nama = update.message.text.strip()
     
-    # Validasi nama tidak boleh kosong
-    if not nama:
-        await update.message.reply_text(
-            "❌ *Nama tidak boleh kosong!*\n\n"
-            "Masukkan *Nama Lengkap* Anda:",
-            parse_mode='Markdown'
-        )
+    # Validasi nama (kosong, panjang, huruf, Title Case), lihat data/validation_rules.json
+    rejection = validator.validate('nama', {'text': nama})
+    if rejection is not None:
+        await update.message.reply_text(rejection, parse_mode='Markdown')
         return NAMA
     
-    # Validasi panjang nama minimal 3 karakter
-    if len(nama) < 3:
-        await update.message.reply_text(
-            "❌ *Nama terlalu pendek!*\n\n"
-            "Nama harus minimal 3 karakter.\n\n"
-            "Masukkan *Nama Lengkap* Anda:",
-            parse_mode='Markdown'
-        )
-        return NAMA
-    
-    # Validasi nama hanya boleh mengandung huruf dan spasi
-    if not nama.replace(' ', '').isalpha():
-        await update.message.reply_text(
-            "❌ *Nama hanya boleh mengandung huruf dan spasi!*\n\n"
-            "Angka dan karakter khusus tidak diperbolehkan.\n\n"
-            "Masukkan *Nama Lengkap* yang benar:",
-            parse_mode='Markdown'
-        )
-        return NAMA
-    
-    # Validasi nama tidak boleh semua huruf kapital atau semua huruf kecil
-    if nama.isupper() or nama.islower():
-        await update.message.reply_text(
-            "❌ *Format nama tidak sesuai!*\n\n"
-            "Nama harus menggunakan format Title Case (huruf pertama kapital).\n\n"
-            "Contoh: *Budi Santoso*\n\n"
-            "Masukkan *Nama Lengkap* dengan format yang benar:",
-            parse_mode='Markdown'
-        )
-        return NAMA
-    
-    user_data_dict[user_id]['nama'] = nama
+    session.nama = nama
     await update.message.reply_text("✅ Nama valid!\n\nMasukkan *NIP/NRP* Anda:", parse_mode='Markdown')
     return NIP
 
 async def get_nip(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    nip = update.message.text.strip()
+    session = sessions.get(update.effective_user.id)
+    if session is None:
+        return await reply_session_expired(update)
     
-    # Validasi NIP tidak boleh kosong
-    if not nip:
-        await update.message.reply_text(
-            "❌ *NIP/NRP tidak boleh kosong!*\n\n"
-            "Masukkan *NIP/NRP* yang valid:",
-            parse_mode='Markdown'
-        )
-        return NIP
-    
-    # Validasi panjang NIP (biasanya 18 digit untuk PNS)
-    if len(nip) < 8 or len(nip) > 20:
-        await update.message.reply_text(
-            "❌ *Format NIP/NRP tidak valid!*\n\n"
-            "NIP/NRP harus memiliki 8-20 karakter.\n\n"
-            "Masukkan *NIP/NRP* yang benar:",
-            parse_mode='Markdown'
-        )
-        return NIP
+    nip = update.message.text.strip()
     
-    # Validasi NIP hanya boleh mengandung angka dan huruf
-    if not nip.replace(' ', '').isalnum():
-        await update.message.reply_text(
-            "❌ *NIP/NRP hanya boleh mengandung angka dan huruf!*\n\n"
-            "Karakter khusus tidak diperbolehkan.\n\n"
-            "Masukkan *NIP/NRP* yang benar:",
-            parse_mode='Markdown'
-        )
+    # Validasi NIP (kosong, panjang, karakter, terdaftar di roster), lihat data/validation_rules.json
+    rejection = validator.validate('nip', {'text': nip})
+    if rejection is not None:
+        await update.message.reply_text(rejection, parse_mode='Markdown')
         return NIP
     
-    user_data_dict[update.effective_user.id]['nip'] = nip
+    session.nip = nip
     await update.message.reply_text("✅ NIP/NRP valid!\n\nMasukkan *Lokasi Tujuan Dinas*:", parse_mode='Markdown')
     return TUJUAN
 
 async def get_tujuan(update: Update, context: ContextTypes.DEFAULT_TYPE):
-      user_data_dict[update.effective_user.id]['tujuan'] = update.message.text
+      session = sessions.get(update.effective_user.id)
+      if session is None:
+          return await reply_session_expired(update)
+      
+      session.tujuan = update.message.text
       
       now = datetime.now()
       calendar_keyboard = create_calendar_keyboard(now.year, now.month)
@@ -241,21 +792,20 @@ async def handle_calendar_selection(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
     
     data = query.data
-    user_id = query.from_user.id
+    session = sessions.get(query.from_user.id)
+    if session is None:
+        return await reply_session_expired(update)
     
     if data.startswith("date_"):
         # Parse tanggal yang dipilih
-        _, year, month, day = data.split("_")
-        selected_date = datetime(int(year), int(month), int(day))
+        year, month, day = parse_calendar_callback(data)
+        selected_date = datetime(year, month, day)
         date_str = selected_date.strftime("%d/%m/%Y")
         
-        if user_id not in user_data_dict:
-            user_data_dict[user_id] = {}
-        
         # Cek apakah ini untuk tanggal mulai atau selesai
-        if 'periode_start' not in user_data_dict[user_id]:
+        if session.periode_start is None:
             # Set tanggal mulai
-            user_data_dict[user_id]['periode_start'] = selected_date
+            session.periode_start = selected_date
             
             # Tampilkan kalender untuk tanggal selesai
             calendar_keyboard = create_calendar_keyboard(selected_date.year, selected_date.month)
@@ -267,7 +817,7 @@ async def handle_calendar_selection(update: Update, context: ContextTypes.DEFAUL
             return PERIODE_END
         else:
             # Set tanggal selesai
-            start_date = user_data_dict[user_id]['periode_start']
+            start_date = session.periode_start
             
             # Validasi tanggal selesai tidak boleh sebelum tanggal mulai
             if selected_date < start_date:
@@ -284,7 +834,8 @@ async def handle_calendar_selection(update: Update, context: ContextTypes.DEFAUL
             durasi = (selected_date - start_date).days + 1
             periode_text = f"{start_date.strftime('%d/%m/%Y')} - {date_str} ({durasi} hari)"
             
-            user_data_dict[user_id]['periode'] = periode_text
+            session.periode = periode_text
+            session.periode_end = selected_date
             
             await query.edit_message_text(
                 f"✅ *Periode Perjalanan Dinas:*\n{periode_text}\n\n"
@@ -295,14 +846,14 @@ async def handle_calendar_selection(update: Update, context: ContextTypes.DEFAUL
     
     elif data.startswith("cal_"):
         # Navigation kalender
-        _, year, month = data.split("_")
-        calendar_keyboard = create_calendar_keyboard(int(year), int(month))
+        year, month = parse_calendar_callback(data)
+        calendar_keyboard = create_calendar_keyboard(year, month)
         
-        current_state = "mulai" if 'periode_start' not in user_data_dict.get(user_id, {}) else "selesai"
+        current_state = "mulai" if session.periode_start is None else "selesai"
         text = f"📅 *Pilih Tanggal {current_state.title()} Perjalanan Dinas:*"
         
         if current_state == "selesai":
-            start_date = user_data_dict[user_id]['periode_start']
+            start_date = session.periode_start
             text = f"✅ Tanggal mulai: *{start_date.strftime('%d/%m/%Y')}*\n\n📅 *Pilih Tanggal Selesai Perjalanan Dinas:*"
         
         await query.edit_message_text(text, parse_mode='Markdown', reply_markup=calendar_keyboard)
@@ -313,11 +864,8 @@ async def handle_calendar_selection(update: Update, context: ContextTypes.DEFAUL
         today = datetime.now()
         date_str = today.strftime("%d/%m/%Y")
         
-        if user_id not in user_data_dict:
-            user_data_dict[user_id] = {}
-        
-        if 'periode_start' not in user_data_dict[user_id]:
-            user_data_dict[user_id]['periode_start'] = today
+        if session.periode_start is None:
+            session.periode_start = today
             calendar_keyboard = create_calendar_keyboard(today.year, today.month)
             await query.edit_message_text(
                 f"✅ Tanggal mulai: *{date_str}*\n\n📅 *Pilih Tanggal Selesai Perjalanan Dinas:*",
@@ -326,11 +874,12 @@ async def handle_calendar_selection(update: Update, context: ContextTypes.DEFAUL
             )
             return PERIODE_END
         else:
-            start_date = user_data_dict[user_id]['periode_start']
+            start_date = session.periode_start
             durasi = (today - start_date).days + 1
             periode_text = f"{start_date.strftime('%d/%m/%Y')} - {date_str} ({durasi} hari)"
             
-            user_data_dict[user_id]['periode'] = periode_text
+            session.periode = periode_text
+            session.periode_end = today
             
             await query.edit_message_text(
                 f"✅ *Periode Perjalanan Dinas:*\n{periode_text}\n\n"
@@ -342,7 +891,11 @@ async def handle_calendar_selection(update: Update, context: ContextTypes.DEFAUL
     return PERIODE_START
 
 async def get_agenda(update: Update, context: ContextTypes.DEFAULT_TYPE):
-      user_data_dict[update.effective_user.id]['agenda'] = update.message.text
+      session = sessions.get(update.effective_user.id)
+      if session is None:
+          return await reply_session_expired(update)
+      
+      session.agenda = update.message.text
       await update.message.reply_text(
           "📍 Silakan *kirim lokasi real-time* Anda.\n\n"
           "⚠️ *PENTING:* Gunakan tombol 📎 (attachment) → Location untuk mengirim lokasi real-time.\n"
@@ -379,72 +932,32 @@ async def reject_text_in_photo_state(update: Update, context: ContextTypes.DEFAU
       return FOTO
 
 async def get_lokasi(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    lokasi = update.message.location
+    session = sessions.get(update.effective_user.id)
+    if session is None:
+        return await reply_session_expired(update)
     
-    # Validasi koordinat tidak boleh 0,0 (fake location)
-    if lokasi.latitude == 0.0 and lokasi.longitude == 0.0:
-        await update.message.reply_text(
-            "❌ *Lokasi tidak valid!*\n\n"
-            "Koordinat 0,0 terdeteksi sebagai lokasi palsu.\n\n"
-            "📍 Silakan kirim lokasi real-time yang valid:",
-            parse_mode='Markdown'
-        )
-        return LOKASI
-    
-    # Validasi koordinat tidak boleh sama persis dengan koordinat terkenal (fake/spoofing)
-    # Koordinat Jakarta: -6.2088, 106.8456
-    # Koordinat Bandung: -6.9175, 107.6191
-    known_fake_coords = [
-        (0.0, 0.0),
-        (-6.2088, 106.8456),  # Jakarta (koordinat umum)
-        (-6.9175, 107.6191),  # Bandung (koordinat umum)
-        (37.7749, -122.4194), # San Francisco
-        (40.7128, -74.0060),  # New York
-        (51.5074, -0.1278),   # London
-    ]
+    lokasi = update.message.location
     
-    for fake_lat, fake_lon in known_fake_coords:
-        if abs(lokasi.latitude - fake_lat) < 0.0001 and abs(lokasi.longitude - fake_lon) < 0.0001:
-            await update.message.reply_text(
-                "❌ *Lokasi terdeteksi sebagai koordinat palsu!*\n\n"
-                "Sistem mendeteksi Anda menggunakan koordinat yang umum digunakan untuk spoofing.\n\n"
-                "📍 Silakan kirim lokasi real-time Anda yang sebenarnya:",
-                parse_mode='Markdown'
-            )
-            return LOKASI
-    
-    # Validasi rentang koordinat Indonesia
-    # Indonesia: Latitude -11 to 6, Longitude 95 to 141
-    if not (-11 <= lokasi.latitude <= 6 and 95 <= lokasi.longitude <= 141):
-        await update.message.reply_text(
-            "❌ *Lokasi di luar wilayah Indonesia!*\n\n"
-            "Sistem mendeteksi lokasi Anda berada di luar wilayah Indonesia.\n\n"
-            "📍 Pastikan GPS aktif dan kirim lokasi real-time yang valid:",
-            parse_mode='Markdown'
-        )
+    # Validasi koordinat (0,0, blacklist spoofing, wilayah Indonesia, presisi, perpindahan
+    # dari lokasi terakhir, geofence tujuan), lihat data/validation_rules.json
+    rejection = validator.validate('lokasi', {'lat': lokasi.latitude, 'lon': lokasi.longitude, 'nip': session.nip})
+    if rejection is not None:
+        await update.message.reply_text(rejection, parse_mode='Markdown')
         return LOKASI
     
-    # Validasi presisi koordinat (koordinat real biasanya memiliki banyak desimal)
-    lat_decimals = len(str(lokasi.latitude).split('.')[-1])
-    lon_decimals = len(str(lokasi.longitude).split('.')[-1])
-    
-    if lat_decimals < 4 or lon_decimals < 4:
-        await update.message.reply_text(
-            "❌ *Lokasi kurang presisi!*\n\n"
-            "Koordinat yang dikirim terlalu bulat, kemungkinan lokasi palsu.\n\n"
-            "📍 Pastikan GPS aktif dan kirim lokasi real-time dengan presisi tinggi:",
-            parse_mode='Markdown'
-        )
-        return LOKASI
+    geofence = geo_guard.geofence_for(lokasi.latitude, lokasi.longitude)
     
     # Simpan lokasi dengan timestamp untuk tracking
-    user_data_dict[update.effective_user.id]['lat'] = lokasi.latitude
-    user_data_dict[update.effective_user.id]['lon'] = lokasi.longitude
-    user_data_dict[update.effective_user.id]['location_timestamp'] = datetime.now().isoformat()
+    session.geofence = geofence
+    session.lat = lokasi.latitude
+    session.lon = lokasi.longitude
+    session.location_timestamp = datetime.now().isoformat()
     
+    area_text = f"📌 Area: {geofence}\n" if geofence else ""
     await update.message.reply_text(
         "✅ *Lokasi real-time diterima!*\n\n"
-        f"📍 Koordinat: {lokasi.latitude:.6f}, {lokasi.longitude:.6f}\n\n"
+        f"📍 Koordinat: {lokasi.latitude:.6f}, {lokasi.longitude:.6f}\n"
+        f"{area_text}\n"
         "📸 Sekarang, silakan kirim *foto kegiatan hari ini*.",
         parse_mode='Markdown'
     )
@@ -464,139 +977,53 @@ async def reject_text_location(update: Update, context: ContextTypes.DEFAULT_TYP
       return LOKASI
 
 async def get_foto(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = sessions.get(update.effective_user.id)
+    if session is None:
+        return await reply_session_expired(update)
+    
     try:
-        # Validasi foto harus dari kamera (bukan file)
         photo = update.message.photo[-1]
-        
-        # Cek apakah foto dikirim sebagai file (dari galeri) atau langsung dari kamera
-        if update.message.document:
-            await update.message.reply_text(
-                "❌ *Foto harus langsung dari kamera!*\n\n"
-                "📸 Silakan gunakan kamera untuk mengambil foto baru, jangan kirim dari galeri.\n\n"
-                "💡 *Cara mengambil foto:*\n"
-                "1. Tekan tombol 📎 (attachment)\n"
-                "2. Pilih 'Camera'\n"
-                "3. Ambil foto langsung dari kamera\n"
-                "4. Kirim foto tersebut",
-                parse_mode='Markdown'
-            )
-            return FOTO
-        
-        # Validasi ketat untuk memastikan foto dari kamera
         file_size = photo.file_size
         width = photo.width
         height = photo.height
         
-        # Validasi 1: Ukuran file minimal (disesuaikan untuk iPhone/Android modern)
-        if file_size and file_size < 30000:  # Kurang dari 30KB (sangat kecil untuk foto kamera)
-            await update.message.reply_text(
-                "❌ *Foto terlalu kecil - kemungkinan bukan dari kamera!*\n\n"
-                "📸 Foto dari kamera iPhone/Android biasanya > 30KB.\n\n"
-                "💡 *Pastikan:*\n"
-                "• Ambil foto LANGSUNG dari kamera\n"
-                "• Tekan tombol 📎 → Camera (bukan Photo & Video)\n"
-                "• Jangan gunakan mode hemat data\n\n"
-                "🔄 Coba lagi dengan foto fresh dari kamera:",
-                parse_mode='Markdown'
-            )
+        # Validasi foto dari kamera (bukan file, ukuran, rasio, jeda dari lokasi, resolusi,
+        # rasio file/pixel, foto berulang), lihat data/validation_rules.json
+        rejection = validator.validate('foto', {
+            'document': update.message.document,
+            'file_size': file_size,
+            'width': width,
+            'height': height,
+            'location_timestamp': session.location_timestamp,
+            'unique_id': photo.file_unique_id
+        })
+        if rejection is not None:
+            await update.message.reply_text(rejection, parse_mode='Markdown')
             return FOTO
         
-        # Validasi 2: Rasio aspek foto (foto kamera modern biasanya 4:3 atau 16:9)
-        if width and height:
-            aspect_ratio = width / height
-            # Foto kamera biasanya memiliki rasio 0.75 (4:3) atau 1.78 (16:9) atau 1.33 (3:4)
-            valid_ratios = [0.75, 1.33, 1.78, 0.56]  # 4:3, 3:4, 16:9, 9:16
-            
-            is_valid_ratio = any(abs(aspect_ratio - ratio) < 0.1 for ratio in valid_ratios)
-            
-            if not is_valid_ratio:
-                await update.message.reply_text(
-                    "❌ *Rasio foto tidak sesuai format kamera!*\n\n"
-                    f"📏 Rasio foto: {aspect_ratio:.2f}\n\n"
-                    "📸 Silakan ambil foto dengan format standar kamera:\n"
-                    "• 4:3 (landscape)\n"
-                    "• 3:4 (portrait)\n"
-                    "• 16:9 (wide)\n\n"
-                    "🔄 Ambil foto baru langsung dari kamera:",
-                    parse_mode='Markdown'
-                )
-                return FOTO
-        
-        # Validasi 3: Cek timestamp foto dengan timestamp lokasi
         current_time = datetime.now()
-        if 'location_timestamp' in user_data_dict[update.effective_user.id]:
-            location_time = datetime.fromisoformat(user_data_dict[update.effective_user.id]['location_timestamp'])
-            time_diff = (current_time - location_time).total_seconds()
-            
-            # Foto harus diambil dalam 5 menit setelah lokasi dikirim
-            if time_diff > 300:  # 5 menit
-                await update.message.reply_text(
-                    "❌ *Foto terlalu lama setelah lokasi dikirim!*\n\n"
-                    "⏱️ Foto harus diambil dalam 5 menit setelah lokasi dikirim.\n\n"
-                    "📸 Silakan ambil foto baru langsung dari kamera:",
-                    parse_mode='Markdown'
-                )
-                return FOTO
-        
-        # Validasi 4: Minimum resolusi untuk foto kamera (disesuaikan untuk iPhone/Android)
-        if width and height:
-            min_resolution = 240  # Minimal 240p (lebih fleksibel untuk foto Telegram)
-            if width < min_resolution or height < min_resolution:
-                await update.message.reply_text(
-                    "❌ *Resolusi foto terlalu rendah!*\n\n"
-                    f"📐 Resolusi: {width}x{height}\n"
-                    f"📏 Minimal: {min_resolution}p\n\n"
-                    "📸 Silakan ambil foto dengan resolusi yang lebih tinggi:\n"
-                    "• Pastikan kamera dalam mode resolusi normal\n"
-                    "• Jangan gunakan mode hemat data\n\n"
-                    "🔄 Ambil foto baru dengan resolusi tinggi:",
-                    parse_mode='Markdown'
-                )
-                return FOTO
         
-        # Validasi 5: Deteksi foto screenshot atau hasil edit (disesuaikan untuk iPhone/Android)
-        # iPhone HEIC→JPEG compression menghasilkan rasio yang berbeda
-        if file_size and width and height:
-            # Hitung rasio file size per pixel
-            pixels = width * height
-            bytes_per_pixel = file_size / pixels
-            
-            # Foto kamera iPhone/Android: 0.1-5 bytes per pixel (lebih fleksibel karena kompresi HEIC→JPEG)
-            # Foto screenshot/edit: biasanya > 8 bytes per pixel atau < 0.05 bytes per pixel
-            if bytes_per_pixel > 8.0 or bytes_per_pixel < 0.05:
-                await update.message.reply_text(
-                    "❌ *Foto terdeteksi sebagai screenshot atau hasil edit!*\n\n"
-                    f"📊 Rasio file/pixel: {bytes_per_pixel:.3f} (tidak normal untuk foto kamera)\n\n"
-                    "📸 Silakan ambil foto LANGSUNG dari kamera:\n"
-                    "• Jangan screenshot foto lain\n"
-                    "• Jangan edit atau filter foto\n"
-                    "• Ambil foto original dari kamera iPhone\n\n"
-                    "🔄 Coba lagi dengan foto fresh dari kamera:",
-                    parse_mode='Markdown'
-                )
-                return FOTO
-        
-        # Simpan file foto dan file_id untuk pengiriman ulang
-        file = await photo.get_file()
-        user_data_dict[update.effective_user.id]['foto_file_id'] = photo.file_id
-        user_data_dict[update.effective_user.id]['foto'] = file.file_path
-        user_data_dict[update.effective_user.id]['foto_timestamp'] = current_time.isoformat()
-        user_data_dict[update.effective_user.id]['foto_size'] = file_size
-        user_data_dict[update.effective_user.id]['foto_resolution'] = f"{width}x{height}"
+        # Simpan file_id untuk pengiriman ulang; file_path & hash di-resolve di background
+        session.foto_file_id = photo.file_id
+        session.foto_unique_id = photo.file_unique_id
+        session.foto_task = asyncio.create_task(resolve_photo(context.bot, photo.file_id))
+        session.foto_timestamp = current_time.isoformat()
+        session.foto_size = file_size
+        session.foto_resolution = f"{width}x{height}"
 
         # Tampilkan konfirmasi data dengan foto
-        data = user_data_dict[update.effective_user.id]
-        gmap = f"https://www.google.com/maps?q={data['lat']},{data['lon']}"
+        data = session
+        gmap = f"https://www.google.com/maps?q={data.lat},{data.lon}"
         
-        status_icon = "🚀" if data['status'] == 'Check-in' else "🏁"
+        status_icon = "🚀" if data.status == 'Check-in' else "🏁"
         konfirmasi_text = (
-            f"📋 *KONFIRMASI DATA {data['status'].upper()}*\n\n"
-            f"{status_icon} **Status:** {data['status']}\n"
-            f"👤 **Nama:** {data['nama']}\n"
-            f"🆔 **NIP/NRP:** {data['nip']}\n"
-            f"📍 **Tujuan:** {data['tujuan']}\n"
-            f"📅 **Periode:** {data['periode']}\n"
-            f"📝 **Agenda:** {data['agenda']}\n"
+            f"📋 *KONFIRMASI DATA {data.status.upper()}*\n\n"
+            f"{status_icon} **Status:** {data.status}\n"
+            f"👤 **Nama:** {data.nama}\n"
+            f"🆔 **NIP/NRP:** {data.nip}\n"
+            f"📍 **Tujuan:** {data.tujuan}\n"
+            f"📅 **Periode:** {data.periode}\n"
+            f"📝 **Agenda:** {data.agenda}\n"
             f"🌍 **Lokasi:** [Lihat di Maps]({gmap})\n\n"
             f"📸 **Foto kegiatan** ✅ *Terverifikasi dari kamera*"
         )
@@ -626,94 +1053,118 @@ async def handle_konfirmasi(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     if query.data == 'konfirmasi_simpan':
+        saved = False
         try:
-            # Simpan ke Sheets dengan lazy loading
-            data = user_data_dict[update.effective_user.id]
-            now = datetime.now()
-            gmap = f"https://www.google.com/maps?q={data['lat']},{data['lon']}"
-
-            sheet = get_sheet()
-            if sheet:
-                sheet.append_row([
-                    now.strftime("%Y-%m-%d %H:%M:%S"),
-                    data['nama'],
-                    data['nip'],
-                    data['tujuan'],
-                    data['periode'],
-                    data['agenda'],
-                    data['lat'],
-                    data['lon'],
-                    gmap,
-                    data['foto'],
-                    data['status']
-                ])
-                
-                # Kirim notifikasi ke group
-                group_sent = await send_group_notification(context, data)
-                
-                keyboard = [
-                    [InlineKeyboardButton("🚀 Check-in Lagi", callback_data='start_checkin')],
-                    [InlineKeyboardButton("🏁 Check-out Lagi", callback_data='start_checkout')]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                status_text = data['status'].lower()
-                success_message = (
-                    "✅ *DATA BERHASIL DISIMPAN!*\n\n"
-                    f"{data['status']} harian Anda telah tercatat dengan sukses."
-                )
-                
-                if group_sent:
-                    success_message += "\n📢 Notifikasi telah dikirim ke group!"
-                else:
-                    success_message += "\n⚠️ Data tersimpan, tapi gagal kirim ke group."
-                
-                success_message += "\n\nTerima kasih!"
-                
-                # Hapus pesan lama dan kirim pesan baru (karena pesan sebelumnya adalah foto)
+            data = sessions.get(update.effective_user.id)
+            if data is None:
+                return await reply_session_expired(update)
+            
+            # Ambil file_path & hash foto (biasanya sudah selesai di background)
+            data.foto, data.foto_hash = await photo_for_save(context.bot, data)
+            match = await asyncio.to_thread(photo_index.find_similar, data.foto_hash) if data.foto_hash is not None else None
+            if match:
                 await query.message.delete()
                 await context.bot.send_message(
                     chat_id=query.message.chat.id,
-                    text=success_message,
-                    parse_mode='Markdown',
-                    reply_markup=reply_markup
+                    text=reused_photo_text(match[1]),
+                    parse_mode='Markdown'
                 )
-            else:
-                keyboard = [[InlineKeyboardButton("🔄 Coba Lagi", callback_data='start_checkin')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                # Hapus pesan lama dan kirim pesan baru
-                await query.message.delete()
-                await context.bot.send_message(
-                    chat_id=query.message.chat.id,
-                    text="❌ Tidak dapat terhubung ke database. Data tidak tersimpan.",
+                return FOTO
+            
+            now = datetime.now()
+            gmap = f"https://www.google.com/maps?q={data.lat},{data.lon}"
+
+            row = [
+                now.strftime("%Y-%m-%d %H:%M:%S"),
+                data.nama,
+                data.nip,
+                data.tujuan,
+                data.periode,
+                data.agenda,
+                data.lat,
+                data.lon,
+                gmap,
+                data.foto,
+                data.status
+            ]
+            
+            # Tulis ke journal lokal, pengiriman ke Sheets berjalan di background
+            entry_id = journal.append(row)
+            sheet_writer.put((entry_id, row))
+            # Sejak titik ini data sudah tersimpan: error berikutnya tidak boleh meminta user mengirim ulang
+            saved = True
+            if storage is not shipping_storage:
+                # Mode tee: store lokal langsung terisi, salinan ke Sheets lewat write-behind queue
+                storage.append_rows([row])
+            travel_index.update(data.nip, data.lat, data.lon, now)
+            photo_index.add(data.foto_hash, data.nip, row[0], data.foto_unique_id)
+            profiles.remember(update.effective_user.id, data)
+            
+            keyboard = repeat_trip_buttons(update.effective_user.id) + [
+                [InlineKeyboardButton("🚀 Check-in Lagi", callback_data='start_checkin')],
+                [InlineKeyboardButton("🏁 Check-out Lagi", callback_data='start_checkout')]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            success_message = (
+                "✅ *DATA BERHASIL DISIMPAN!*\n\n"
+                f"{data.status} harian Anda telah tercatat dengan sukses."
+            )
+            
+            # Hapus pesan lama dan kirim pesan baru (karena pesan sebelumnya adalah foto)
+            await query.message.delete()
+            sent = await context.bot.send_message(
+                chat_id=query.message.chat.id,
+                text=success_message + "\n📢 Notifikasi sedang dikirim ke group...\n\nTerima kasih!",
+                parse_mode='Markdown',
+                reply_markup=reply_markup
+            )
+            
+            # Status pengiriman ke group dilaporkan dengan mengedit pesan sukses
+            async def report_group_status(group_sent):
+                if group_sent:
+                    status_line = "\n📢 Notifikasi telah dikirim ke group!"
+                else:
+                    status_line = "\n⚠️ Data tersimpan, tapi gagal kirim ke group."
+                await sent.edit_text(
+                    success_message + status_line + "\n\nTerima kasih!",
+                    parse_mode='Markdown',
                     reply_markup=reply_markup
                 )
             
-            user_data_dict.pop(update.effective_user.id)
+            send_group_notification(context.bot, data, now, on_done=report_group_status)
+            
+            sessions.pop(update.effective_user.id)
             return ConversationHandler.END
             
         except Exception as e:
+            if saved:
+                # Baris sudah di journal dan antrian Sheets: jangan minta kirim ulang (data jadi ganda)
+                sessions.pop(update.effective_user.id)
+                text = "✅ Data Anda sudah tersimpan, tetapi notifikasi gagal dikirim. Tidak perlu mengirim ulang."
+                keyboard = [
+                    [InlineKeyboardButton("🚀 Check-in Lagi", callback_data='start_checkin')],
+                    [InlineKeyboardButton("🏁 Check-out Lagi", callback_data='start_checkout')]
+                ]
+            else:
+                text = "❌ Terjadi kesalahan saat menyimpan data. Silakan coba lagi."
+                keyboard = [[InlineKeyboardButton("🔄 Coba Lagi", callback_data='start_checkin')]]
             try:
                 # Hapus pesan lama dan kirim pesan baru
                 await query.message.delete()
-                keyboard = [[InlineKeyboardButton("🔄 Coba Lagi", callback_data='start_checkin')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
                 await context.bot.send_message(
                     chat_id=query.message.chat.id,
-                    text="❌ Terjadi kesalahan saat menyimpan data. Silakan coba lagi.",
-                    reply_markup=reply_markup
+                    text=text,
+                    reply_markup=InlineKeyboardMarkup(keyboard)
                 )
             except:
                 # Jika gagal hapus pesan, kirim pesan baru saja
-                await query.message.reply_text("❌ Terjadi kesalahan saat menyimpan data. Silakan coba lagi.")
+                await query.message.reply_text(text)
             print(f"Error: {e}")
             return ConversationHandler.END
     
     elif query.data == 'konfirmasi_reset':
-        user_id = query.from_user.id
-        if user_id in user_data_dict:
-            user_data_dict.pop(user_id)
+        sessions.pop(query.from_user.id)
         
         keyboard = [[InlineKeyboardButton("🚀 Mulai Check-in Baru", callback_data='start_checkin')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -733,7 +1184,11 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     if query.data == 'start_checkin':
-        user_data_dict[query.from_user.id] = {'status': 'Check-in'}
+        session = sessions.start(query.from_user.id, 'Check-in')
+        prefill_text = prefill_from_roster(session, query.from_user.id)
+        if prefill_text:
+            await query.edit_message_text("🚀 Mari mulai check-in harian Anda!\n\n" + prefill_text, parse_mode='Markdown')
+            return TUJUAN
         await query.edit_message_text(
             "🚀 Mari mulai check-in harian Anda!\n\nMasukkan *Nama Lengkap* Anda:",
             parse_mode='Markdown'
@@ -741,17 +1196,45 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return NAMA
     
     elif query.data == 'start_checkout':
-        user_data_dict[query.from_user.id] = {'status': 'Check-out'}
+        session = sessions.start(query.from_user.id, 'Check-out')
+        prefill_text = prefill_from_roster(session, query.from_user.id)
+        if prefill_text:
+            await query.edit_message_text("🏁 Mari mulai check-out harian Anda!\n\n" + prefill_text, parse_mode='Markdown')
+            return TUJUAN
         await query.edit_message_text(
             "🏁 Mari mulai check-out harian Anda!\n\nMasukkan *Nama Lengkap* Anda:",
             parse_mode='Markdown'
         )
         return NAMA
     
+    elif query.data in ('repeat_checkin', 'repeat_checkout'):
+        profile = profiles.active_trip(query.from_user.id)
+        if profile is None:
+            await query.edit_message_text(
+                "⌛ *Periode perjalanan sebelumnya sudah berakhir.*\n\n"
+                "Silakan isi data perjalanan baru:",
+                parse_mode='Markdown',
+                reply_markup=main_menu_keyboard(query.from_user.id)
+            )
+            return ConversationHandler.END
+        
+        status = 'Check-in' if query.data == 'repeat_checkin' else 'Check-out'
+        session = sessions.start(query.from_user.id, status)
+        profile.apply(session)
+        status_icon = "🚀" if status == 'Check-in' else "🏁"
+        await query.edit_message_text(
+            f"{status_icon} *{status} - perjalanan yang sama*\n\n"
+            f"👤 *Nama:* {session.nama}\n"
+            f"🆔 *NIP/NRP:* {session.nip}\n"
+            f"📍 *Tujuan:* {session.tujuan}\n"
+            f"📅 *Periode:* {session.periode}\n\n"
+            "Sekarang, apa *Agenda Hari Ini*?",
+            parse_mode='Markdown'
+        )
+        return AGENDA
+    
     elif query.data == 'reset_data':
-        user_id = query.from_user.id
-        if user_id in user_data_dict:
-            user_data_dict.pop(user_id)
+        sessions.pop(query.from_user.id)
         
         keyboard = [
             [InlineKeyboardButton("🚀 Check-in Baru", callback_data='start_checkin')],
@@ -784,6 +1267,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "• Otomatis tersimpan ke Google Sheets\n\n"
             "*Perintah:*\n"
             "/start - Mulai/restart bot\n"
+            "/rekap - Rekap laporan (hari ini, tanggal, atau NIP)\n"
+            "/durasi - Durasi dinas dari pasangan check-in/check-out\n"
             "/cancel - Batalkan proses",
             parse_mode='Markdown',
             reply_markup=reply_markup
@@ -791,13 +1276,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     
     elif query.data == 'back_to_menu':
-        keyboard = [
-            [InlineKeyboardButton("🚀 Check-in", callback_data='start_checkin')],
-            [InlineKeyboardButton("🏁 Check-out", callback_data='start_checkout')],
-            [InlineKeyboardButton("🔄 Reset Data", callback_data='reset_data')],
-            [InlineKeyboardButton("ℹ️ Info Bot", callback_data='info_bot')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = main_menu_keyboard(query.from_user.id)
         
         await query.edit_message_text(
             "🤖 *Bot Monitoring Dinas*\n\n"
@@ -808,9 +1287,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-      user_id = update.effective_user.id
-      if user_id in user_data_dict:
-          user_data_dict.pop(user_id)
+      sessions.pop(update.effective_user.id)
       
       keyboard = [[InlineKeyboardButton("🚀 Mulai Lagi", callback_data='start_checkin')]]
       reply_markup = InlineKeyboardMarkup(keyboard)
@@ -821,11 +1298,134 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
       )
       return ConversationHandler.END
 
+async def session_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Command untuk melihat isi session store - gunakan /stats"""
+    if not await require_rekap_access(update, 'stats'):
+        return
+    stats = sessions.stats()
+    await update.message.reply_text(
+        f"Sessions: {stats['sessions']}/{stats['capacity']} ({stats['occupancy']:.1%})\n"
+        f"Memory: ~{stats['approx_bytes'] / 1024:.1f} KB\n"
+        f"Evicted (TTL/LRU): {stats['evicted_ttl']}/{stats['evicted_lru']}"
+    )
+
+async def validation_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Command untuk melihat statistik rule validasi sesuai urutan evaluasi - gunakan /validasi"""
+    if not await require_rekap_access(update, 'validasi'):
+        return
+    lines = []
+    for stage, rule, evaluated, rejected, seconds in validator.stats():
+        rate = rejected / evaluated if evaluated else 0.0
+        cost_us = seconds / evaluated * 1e6 if evaluated else 0.0
+        lines.append(f"{stage}/{rule}: {evaluated} eval, {rejected} tolak ({rate:.1%}), {cost_us:.1f} µs")
+    await update.message.reply_text("\n".join(lines) or "Belum ada rule validasi.")
+
+async def rekap_allowed(update: Update):
+    """User di REKAP_ALLOWED_USERS, atau admin group jika daftar kosong (status di-cache sebentar)."""
+    user_id = update.effective_user.id
+    if REKAP_ALLOWED_USERS:
+        return user_id in REKAP_ALLOWED_USERS
+    cached = rekap_admin_cache.get(user_id)
+    if cached is not None and time.monotonic() - cached[1] < REKAP_ADMIN_CACHE_SECONDS:
+        return cached[0]
+    try:
+        member = await update.get_bot().get_chat_member(GROUP_CHAT_ID, user_id)
+        is_admin = member.status in ('administrator', 'creator')
+    except Exception as e:
+        print(f"Error checking admin status: {e}")
+        return False
+    rekap_admin_cache[user_id] = (is_admin, time.monotonic())
+    return is_admin
+
+async def require_rekap_access(update: Update, command):
+    """Balas penolakan jika user tidak boleh memakai perintah admin (/rekap, /stats, ...)."""
+    if await rekap_allowed(update):
+        return True
+    await update.message.reply_text(f"❌ Anda tidak memiliki akses ke /{command}.")
+    return False
+
+async def prepare_log_mirror(update: Update, command):
+    """Cek akses lalu sinkronkan mirror jika sudah lama; False jika perintah tidak bisa dilayani."""
+    if not await require_rekap_access(update, command):
+        return False
+
+    # Ambil baris baru lebih dulu jika mirror sudah lama tidak disinkronkan
+    if log_mirror.synced_at is None or (datetime.now() - log_mirror.synced_at).total_seconds() > REKAP_SYNC_INTERVAL:
+        try:
+            await sync_log_mirror()
+        except Exception as e:
+            print(f"Error syncing log mirror: {e}")
+    if log_mirror.synced_at is None:
+        await update.message.reply_text("⏳ Data rekap belum tersedia, silakan coba beberapa saat lagi.")
+        return False
+    return True
+
+async def rekap(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Command rekap check-in/check-out - /rekap, /rekap 17/10/2026 atau /rekap <NIP>"""
+    if not await prepare_log_mirror(update, 'rekap'):
+        return
+
+    arg = context.args[0] if context.args else ''
+    day = parse_rekap_date(arg) if arg else datetime.now().date()
+
+    if day is None:
+        # Argumen bukan tanggal: anggap sebagai NIP
+        rows = log_mirror.rows_for_nip(arg, limit=REKAP_MAX_LINES)
+        if not len(rows):
+            await update.message.reply_text(f"ℹ️ Tidak ada data untuk NIP/NRP {arg}.")
+            return
+        lines = [format_rekap_line(log_mirror.record(index), with_date=True) for index in rows]
+        header = f"📊 *Rekap NIP/NRP {escape_markdown(arg)}*\n{len(rows)} laporan terakhir:\n\n"
+    else:
+        counts, latest = log_mirror.summary_on(day)
+        rows = log_mirror.rows_on(day)
+        lines = [format_rekap_line(log_mirror.record(index)) for index in rows[:REKAP_MAX_LINES]]
+        if len(rows) > REKAP_MAX_LINES:
+            lines.append(f"... dan {len(rows) - REKAP_MAX_LINES} laporan lainnya")
+        header = (
+            f"📊 *Rekap {day.strftime('%d/%m/%Y')}*\n"
+            f"🚀 Check-in: {counts.get('Check-in', 0)} | 🏁 Check-out: {counts.get('Check-out', 0)}\n"
+            f"👥 Pegawai: {len(latest)}\n\n"
+        )
+        if not lines:
+            lines = ["Belum ada laporan."]
+
+    await update.message.reply_text(header + "\n".join(lines), parse_mode='Markdown')
+
+async def durasi_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Command durasi dinas per pegawai dari pasangan check-in/check-out - /durasi [tanggal]"""
+    if not await prepare_log_mirror(update, 'durasi'):
+        return
+
+    day = parse_rekap_date(context.args[0]) if context.args else datetime.now().date()
+    if day is None:
+        await update.message.reply_text("❌ Format tanggal tidak valid. Contoh: /durasi 17/10/2026")
+        return
+
+    lines = []
+    for checkin_index, checkout_index, seconds in pairing.pairs_on(day):
+        _, nama, nip, _, _ = log_mirror.record(checkin_index)
+        lines.append(
+            f"✅ {escape_markdown(nama)} ({escape_markdown(nip)}): {log_mirror.timestamps[checkin_index][11:16]}-"
+            f"{log_mirror.timestamps[checkout_index][11:16]} ({format_duration(seconds)})"
+        )
+    for index, reason in pairing.unmatched_on(day):
+        timestamp, nama, nip, _, _ = log_mirror.record(index)
+        lines.append(f"⚠️ {escape_markdown(nama)} ({escape_markdown(nip)}) {timestamp[11:16]}: {reason}")
+    for index in (pairing.open_on(day) if day == datetime.now().date() else ()):
+        timestamp, nama, nip, _, _ = log_mirror.record(index)
+        lines.append(f"⏳ {escape_markdown(nama)} ({escape_markdown(nip)}): check-in {timestamp[11:16]}, belum check-out")
+
+    if len(lines) > REKAP_MAX_LINES:
+        lines = lines[:REKAP_MAX_LINES] + [f"... dan {len(lines) - REKAP_MAX_LINES} baris lainnya"]
+    await update.message.reply_text(
+        f"⏱️ *Durasi Dinas {day.strftime('%d/%m/%Y')}*\n\n" + ("\n".join(lines) or "Belum ada laporan."),
+        parse_mode='Markdown'
+    )
+
   # ====== Main Bot Setup ======
 async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id in user_data_dict:
-        user_data_dict.pop(user_id)
+    sessions.pop(update.effective_user.id)
     
     keyboard = [[InlineKeyboardButton("🚀 Mulai Check-in Baru", callback_data='start_checkin')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -835,48 +1435,175 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
 
-def main():
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+# ====== Gauge Metrics ======
+# Nilai gauge hanya dihitung saat endpoint di-scrape
+metrics.gauge('bot_sessions', 'Draft form aktif di session store', lambda: len(sessions))
+metrics.gauge('bot_sessions_bytes', 'Perkiraan memori session store', lambda: sessions.stats()['approx_bytes'])
+metrics.gauge('bot_sheet_write_queue', 'Baris yang menunggu dikirim ke Sheets', lambda: sheet_writer.qsize())
+metrics.gauge('bot_journal_unshipped', 'Baris journal yang belum terkirim ke Sheets', lambda: journal.unshipped_count())
+metrics.gauge('bot_notification_queue', 'Notifikasi group yang menunggu dikirim', lambda: notifier.qsize())
+metrics.gauge('bot_log_mirror_rows', 'Baris Log di mirror /rekap', lambda: len(log_mirror))
+metrics.collected('bot_validation_evaluations_total', 'Evaluasi per rule validasi', 'counter', ('stage', 'rule'),
+                  lambda: [((stage, rule), evaluated) for stage, rule, evaluated, _, _ in validator.stats()])
+metrics.collected('bot_validation_rejections_total', 'Penolakan per rule validasi', 'counter', ('stage', 'rule'),
+                  lambda: [((stage, rule), rejected) for stage, rule, _, rejected, _ in validator.stats()])
+metrics.collected('bot_validation_seconds_total', 'Total waktu evaluasi per rule validasi', 'counter', ('stage', 'rule'),
+                  lambda: [((stage, rule), seconds) for stage, rule, _, _, seconds in validator.stats()])
+
+background_tasks = []
+
+async def on_startup(application: Application):
+    # Sheets hanya dibutuhkan oleh write-behind queue, mirror /rekap dan roster (jika tidak dari CSV)
+    if shipping_storage.remote or not ROSTER_CSV:
+        background_tasks.append(asyncio.create_task(sheets_warmup()))
+    else:
+        sheets_ready.set()
+    sheet_writer.start()
+    notifier.start()
+    if metrics_server is not None:
+        await metrics_server.start()
+        print(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    blacklisted, geofences = geo_guard.reload()
+    print(f"Loaded spatial index: {blacklisted} blacklisted points, {geofences} geofences")
+    if land_mask is None:
+        print(f"⚠️ Land mask {LAND_MASK_PATH} tidak ditemukan, cek wilayah Indonesia memakai bounding box kasar. "
+              f"Bangun dengan: python scripts/build_land_mask.py <batas_wilayah.geojson> --out {LAND_MASK_PATH}")
+    background_tasks.append(asyncio.create_task(geo_reload_loop()))
+    print(f"Compiled {validator.reload()} validation rules from {VALIDATION_RULES_PATH}")
+    background_tasks.append(asyncio.create_task(validation_reload_loop()))
+    background_tasks.append(asyncio.create_task(roster_refresh_loop()))
+    print(f"Loaded {profiles.load()} trip profiles")
+    if profiles.path:
+        background_tasks.append(asyncio.create_task(profile_save_loop()))
+    background_tasks.append(asyncio.create_task(log_mirror_loop()))
+    warm_calendar_cache()
+    # Riwayat journal dimuat di background; baris dengan id > history_upto masuk lewat handler
+    history_upto = journal.last_id()
+    background_tasks.append(asyncio.create_task(history_warmup(history_upto)))
+    if memory_store is not None and memory_store is shipping_storage:
+        # Baris yang belum terkirim ikut diisi ulang dari journal, tidak perlu di-replay
+        journal.mark_shipped([entry_id for entry_id, _ in journal.unshipped(upto=history_upto)])
+    
+    restored = load_sessions()
+    if restored:
+        print(f"Restored {restored} in-flight sessions from snapshot")
+    if SESSIONS_PERSISTENT:
+        background_tasks.append(asyncio.create_task(session_maintenance()))
+    
+    # Replay baris yang belum sempat terkirim sebelum restart
+    pending = journal.unshipped(upto=CLUSTER_REPLAY_UPTO) if CLUSTER_WORKER == 0 else []
+    for entry in pending:
+        sheet_writer.put(entry)
+    if pending:
+        print(f"Replaying {len(pending)} unshipped rows from journal")
+    print(f"Startup complete {time.perf_counter() - PROCESS_STARTED:.2f}s after process start")
+
+async def on_shutdown(application: Application):
+    for task in background_tasks:
+        task.cancel()
+    save_sessions()
+    profiles.save_if_dirty()
+    
+    if metrics_server is not None:
+        await metrics_server.stop()
+    
+    # Flush sisa antrian sebelum proses berhenti
+    await notifier.stop()
+    await sheet_writer.stop()
+    sheets_executor.shutdown()
+    photo_index.shutdown()
+    journal.close()
+    storage.close()
+    if cluster_store is not None:
+        cluster_store.close()
+
+def build_conversation_handler():
+    """ConversationHandler form dinas; dipakai main() dan scripts/loadtest.py."""
+    # Durasi setiap handler dicatat per nama fungsi untuk endpoint metrics
+    timed = functools.partial(timed_handler, handler_latency)
 
-    conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start), CallbackQueryHandler(button_callback, pattern='^start_checkin$|^start_checkout$')],
+    return ConversationHandler(
+        entry_points=[CommandHandler('start', timed(start)), CallbackQueryHandler(timed(button_callback), pattern='^start_checkin$|^start_checkout$|^repeat_checkin$|^repeat_checkout$')],
         states={
-            STATUS: [CallbackQueryHandler(button_callback)],
+            STATUS: [CallbackQueryHandler(timed(button_callback))],
             NAMA: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, get_nama),
-                CallbackQueryHandler(button_callback)
+                MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_nama)),
+                CallbackQueryHandler(timed(button_callback))
             ],
-            NIP: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_nip)],
-            TUJUAN: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_tujuan)],
-            PERIODE_START: [CallbackQueryHandler(handle_calendar_selection)],
-            PERIODE_END: [CallbackQueryHandler(handle_calendar_selection)],
-            AGENDA: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_agenda)],
+            NIP: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_nip))],
+            TUJUAN: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_tujuan))],
+            PERIODE_START: [CallbackQueryHandler(timed(handle_calendar_selection))],
+            PERIODE_END: [CallbackQueryHandler(timed(handle_calendar_selection))],
+            AGENDA: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(get_agenda))],
             LOKASI: [
-                MessageHandler(filters.LOCATION, get_lokasi),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, reject_text_location)
+                MessageHandler(filters.LOCATION, timed(get_lokasi)),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, timed(reject_text_location))
             ],
             FOTO: [
-                MessageHandler(filters.PHOTO, get_foto),
-                MessageHandler(filters.Document.IMAGE, reject_file_photo),
-                MessageHandler(filters.Document.ALL, reject_file_photo),
-                MessageHandler(filters.TEXT & ~filters.COMMAND, reject_text_in_photo_state)
+                MessageHandler(filters.PHOTO, timed(get_foto)),
+                MessageHandler(filters.Document.IMAGE, timed(reject_file_photo)),
+                MessageHandler(filters.Document.ALL, timed(reject_file_photo)),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, timed(reject_text_in_photo_state))
             ],
-            KONFIRMASI: [CallbackQueryHandler(handle_konfirmasi)]
+            KONFIRMASI: [CallbackQueryHandler(timed(handle_konfirmasi))]
         },
-        fallbacks=[CommandHandler('cancel', cancel)],
+        fallbacks=[CommandHandler('cancel', timed(cancel))],
         per_message=False,
         per_chat=True,
-        per_user=True
+        per_user=True,
+        name='form_dinas',
+        persistent=SESSIONS_PERSISTENT
     )
 
+def build_application(builder=None):
+    """Bangun Application lengkap dengan hook startup/shutdown dan semua handler.
+
+    `builder` bisa diisi ApplicationBuilder yang sudah diberi token/request lain (mis. untuk load test).
+    """
+    builder = (
+        (builder or Application.builder().token(TELEGRAM_TOKEN))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .concurrent_updates(PerUserUpdateProcessor(UPDATE_CONCURRENCY))
+    )
+    if cluster_store is not None:
+        builder = builder.persistence(SharedPersistence(
+            cluster_store, CLUSTER_WORKER, CLUSTER_WORKERS, update_interval=SESSION_SNAPSHOT_INTERVAL
+        ))
+    elif sessions.snapshot_path:
+        builder = builder.persistence(PicklePersistence(
+            filepath=CONVERSATION_STATE_PATH,
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=False, callback_data=False)
+        ))
+    application = builder.build()
+    timed = functools.partial(timed_handler, handler_latency)
+
     # Add handlers
-    application.add_handler(conv_handler)
-    application.add_handler(CommandHandler('reset', reset_command))
-    application.add_handler(CommandHandler('getchatid', get_chat_info))  # Untuk mendapatkan Chat ID
-    application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(TypeHandler(Update, note_first_update), group=-1)
+    application.add_handler(build_conversation_handler())
+    application.add_handler(CommandHandler('reset', timed(reset_command)))
+    application.add_handler(CommandHandler('getchatid', timed(get_chat_info)))  # Untuk mendapatkan Chat ID
+    application.add_handler(CommandHandler('stats', timed(session_stats)))
+    application.add_handler(CommandHandler('validasi', timed(validation_stats)))
+    application.add_handler(CommandHandler('rekap', timed(rekap)))
+    application.add_handler(CommandHandler('durasi', timed(durasi_command)))
+    application.add_handler(CallbackQueryHandler(timed(button_callback)))
+    return application
+
+def main():
+    application = build_application()
     
     print("Bot started successfully!")
-    application.run_polling()
+    if BOT_MODE == 'webhook':
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            webhook_url=WEBHOOK_URL
+        )
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
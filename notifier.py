@@ -0,0 +1,141 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError, TimedOut
+
+
+# ====== Token Bucket ======
+class TokenBucket:
+    """Rate limiter token bucket: `rate` token per detik dengan kapasitas `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds):
+        """Tahan semua pengiriman (misalnya setelah Telegram membalas RetryAfter)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# ====== Dispatcher Notifikasi Group ======
+class NotificationDispatcher:
+    """Kirim notifikasi ke group dari antrian, di background dan paralel.
+
+    Setiap chat punya token bucket sendiri (default 20 pesan/menit, batas Telegram
+    untuk group). RetryAfter dari Telegram menahan bucket chat tersebut, error
+    jaringan dicoba ulang dengan exponential backoff, dan hasil akhirnya
+    (True/False) dilaporkan lewat callback `on_done` tanpa memblokir user.
+    """
+
+    def __init__(self, workers=4, rate_per_minute=20, burst=3, max_attempts=5, backoff_base=1.0, backoff_max=60.0,
+                 bucket_factory=None):
+        self.workers = workers
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # bucket_factory(chat_id, rate, capacity) untuk bucket yang dibagi antar proses (mode cluster)
+        self.bucket_factory = bucket_factory or (lambda chat_id, rate, capacity: TokenBucket(rate, capacity))
+        self._queue = asyncio.Queue()
+        self._buckets = {}
+        self._tasks = []
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def submit(self, chat_id, send, on_done=None):
+        """Antrekan pengiriman. `send` adalah fungsi tanpa argumen yang mengembalikan coroutine."""
+        self._queue.put_nowait((chat_id, send, on_done))
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=10.0):
+        """Tunggu antrian habis (maksimal `timeout` detik) lalu hentikan worker."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self._queue.qsize()} notifikasi group belum terkirim saat shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = self.bucket_factory(chat_id, self.rate, self.burst)
+        return bucket
+
+    async def _deliver(self, chat_id, send):
+        bucket = self._bucket(chat_id)
+        delay = self.backoff_base
+        for attempt in range(1, self.max_attempts + 1):
+            await bucket.acquire()
+            try:
+                await send()
+                return True
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                print(f"Flood limit for chat {chat_id}, retrying after {retry_after}s")
+                bucket.pause(retry_after)
+            except BadRequest as e:
+                # BadRequest adalah turunan NetworkError, tapi tidak akan berhasil jika dicoba ulang
+                print(f"Error sending group notification: {e}")
+                print(f"Group Chat ID yang digunakan: {chat_id}")
+                return False
+            except (TimedOut, NetworkError) as e:
+                print(f"Error sending group notification (attempt {attempt}/{self.max_attempts}): {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.backoff_max)
+            except TelegramError as e:
+                # Forbidden dll. juga tidak perlu dicoba ulang
+                print(f"Error sending group notification: {e}")
+                print(f"Group Chat ID yang digunakan: {chat_id}")
+                return False
+        return False
+
+    async def _worker(self):
+        while True:
+            chat_id, send, on_done = await self._queue.get()
+            try:
+                try:
+                    delivered = await self._deliver(chat_id, send)
+                except Exception as e:
+                    # Error di luar yang ditangani _deliver tetap dianggap gagal kirim,
+                    # agar pesan status pengguna diperbarui dan latensi tercatat
+                    print(f"Error in notification dispatcher: {e}")
+                    delivered = False
+                if on_done is not None:
+                    await on_done(delivered)
+            except Exception as e:
+                print(f"Error in notification callback: {e}")
+            finally:
+                self._queue.task_done()
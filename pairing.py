@@ -0,0 +1,78 @@
+from datetime import datetime
+
+
+# Alasan baris ditandai tidak berpasangan
+CHECKOUT_WITHOUT_CHECKIN = 'check-out tanpa check-in'
+DUPLICATE_CHECKIN = 'check-in ganda'
+CHECKIN_WITHOUT_CHECKOUT = 'check-in tanpa check-out'
+
+
+# ====== Pasangan Check-in/Check-out ======
+class PairingEngine:
+    """Pasangkan setiap check-out dengan check-in yang masih terbuka untuk NIP dan hari yang sama.
+
+    Engine membaca baris dari LogMirror mulai dari cursor terakhir, jadi setiap
+    proses hanya menyentuh baris yang baru masuk. Check-in terbuka, hasil pasangan
+    dan baris yang ditandai semuanya di-index per tanggal (check-in terbuka juga per NIP).
+    """
+
+    def __init__(self):
+        self.cursor = 0
+        self.open = {}
+        self.pairs_by_day = {}
+        self.flags_by_day = {}
+
+    def process(self, mirror):
+        """Proses baris mirror yang belum pernah dilihat; kembalikan jumlah baris baru."""
+        start = self.cursor
+        for index in range(start, len(mirror)):
+            self._add(mirror, index)
+        self.cursor = len(mirror)
+        return self.cursor - start
+
+    def _add(self, mirror, index):
+        status = mirror.status[index]
+        if status not in ('Check-in', 'Check-out'):
+            return
+        try:
+            when = datetime.fromisoformat(mirror.timestamps[index])
+        except ValueError:
+            return
+        day, nip = when.date(), mirror.nip[index]
+        open_today = self.open.setdefault(day, {})
+        if status == 'Check-in':
+            if nip in open_today:
+                self._flag(day, index, DUPLICATE_CHECKIN)
+            else:
+                open_today[nip] = (index, when)
+            return
+        opened = open_today.pop(nip, None)
+        if opened is None:
+            self._flag(day, index, CHECKOUT_WITHOUT_CHECKIN)
+            return
+        checkin_index, checkin_time = opened
+        duration = (when - checkin_time).total_seconds()
+        self.pairs_by_day.setdefault(day, []).append((checkin_index, index, duration))
+
+    def _flag(self, day, index, reason):
+        self.flags_by_day.setdefault(day, []).append((index, reason))
+
+    def pairs_on(self, day):
+        """List (index_check_in, index_check_out, durasi_detik) untuk satu tanggal."""
+        return self.pairs_by_day.get(day, [])
+
+    def unmatched_on(self, day, today=None):
+        """Baris yang ditandai pada satu tanggal, termasuk check-in yang tidak ditutup
+        sampai hari berganti (check-in hari ini masih dianggap berjalan)."""
+        flagged = list(self.flags_by_day.get(day, []))
+        if day < (today or datetime.now().date()):
+            flagged.extend((index, CHECKIN_WITHOUT_CHECKOUT) for index in self.open_on(day))
+        return sorted(flagged)
+
+    def open_on(self, day):
+        return sorted(index for index, _ in self.open.get(day, {}).values())
+
+
+def format_duration(seconds):
+    minutes = int(seconds // 60)
+    return f"{minutes // 60}j {minutes % 60:02d}m"
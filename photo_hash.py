@@ -0,0 +1,250 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: tanpa lock file, index hanya aman dipakai satu proses
+    fcntl = None
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow opsional: tanpa Pillow hanya file_unique_id yang dicek
+    Image = None
+
+
+def dhash(image_bytes, size=8):
+    """Difference hash 64-bit dari isi gambar (dijalankan di process pool)."""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = image.convert('L').resize((size + 1, size), Image.LANCZOS)
+        pixels = list(image.getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+# ====== BK-tree (pembanding di scripts/bench_photo_hash.py) ======
+class BKTree:
+    """BK-tree dengan jarak Hamming untuk mencari hash yang mirip (near-duplicate)."""
+
+    __slots__ = ('_root', '_size')
+
+    def __init__(self):
+        # Node: [hash, items, {jarak: child}]
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, item):
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = (value ^ node[0]).bit_count()
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Semua (jarak, item) dengan jarak Hamming <= max_distance."""
+        if self._root is None:
+            return []
+        results = []
+        stack = [self._root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = (value ^ node_value).bit_count()
+            if distance <= max_distance:
+                results.extend((distance, item) for item in items)
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in children.items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        return results
+
+
+# ====== Multi-index Hash ======
+class MultiIndexHash:
+    """Index hash 64-bit untuk pencarian jarak Hamming <= max_distance (multi-index hashing).
+
+    Hash dipecah menjadi max_distance + 1 blok bit; menurut pigeonhole, dua hash dengan
+    jarak <= max_distance pasti sama persis di minimal satu blok. Pencarian cukup mengecek
+    kandidat di bucket blok yang sama (sekitar n / 2^(64 / blok) per blok), bukan menelusuri
+    seluruh BK-tree.
+    """
+
+    __slots__ = ('max_distance', '_blocks', '_tables', '_entries')
+
+    def __init__(self, max_distance, bits=64):
+        self.max_distance = max_distance
+        count = min(max_distance + 1, bits)
+        self._blocks = []  # (shift, mask) per blok
+        shift = 0
+        for i in range(count):
+            width = bits // count + (1 if i < bits % count else 0)
+            self._blocks.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables = [{} for _ in range(count)]
+        self._entries = []  # (hash, item); bucket menyimpan posisi entri
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, value, item):
+        index = len(self._entries)
+        self._entries.append((value, item))
+        for (shift, mask), table in zip(self._blocks, self._tables):
+            table.setdefault((value >> shift) & mask, []).append(index)
+
+    def search(self, value, max_distance=None):
+        """Semua (jarak, item) dengan jarak Hamming <= max_distance (maks. max_distance index)."""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        results = []
+        seen = set()
+        entries = self._entries
+        for (shift, mask), table in zip(self._blocks, self._tables):
+            for index in table.get((value >> shift) & mask, ()):
+                if index in seen:
+                    continue
+                seen.add(index)
+                stored, item = entries[index]
+                distance = (value ^ stored).bit_count()
+                if distance <= max_distance:
+                    results.append((distance, item))
+        return results
+
+
+# ====== Index Foto ======
+class PhotoHashIndex:
+    """Index hash foto yang pernah dikonfirmasi, disimpan append-only di disk.
+
+    Hash dihitung di process pool (spawn) agar decoding gambar tidak membebani event loop;
+    hash mirip dicari lewat MultiIndexHash.
+    Saat load, file hanya dibaca dari offset terakhir sehingga index bertambah
+    secara incremental. Jika `shared` (mode cluster), file dipakai bersama oleh
+    beberapa proses: append dilakukan di bawah lock file dan entri dari proses lain
+    dibaca lebih dulu setiap kali index dicari.
+
+    Sebelum load() pertama selesai (warmup di background), add() hanya menambahkan baris
+    ke file dan pencarian tidak membaca file; baris baru itu ikut terbaca oleh load() tersebut,
+    jadi event loop tidak pernah mem-parse seluruh riwayat.
+    """
+
+    def __init__(self, path, max_distance=6, workers=2, shared=False):
+        self.path = path
+        self.max_distance = max_distance
+        self.workers = workers
+        self.shared = shared
+        self.enabled = Image is not None
+        self._index = MultiIndexHash(max_distance)
+        self._unique_ids = {}
+        self._offset = 0
+        self._loaded = False
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return max(len(self._index), len(self._unique_ids))
+
+    def load(self, batch_size=5000):
+        """Baca entri baru dari file index (mulai dari offset terakhir).
+
+        Lock dilepas setiap `batch_size` baris sehingga add()/pencarian di thread lain
+        tidak menunggu sampai seluruh file (mis. saat warmup startup) selesai dibaca.
+        """
+        with self._lock:
+            # Dicek di bawah lock: file yang baru dibuat oleh add() tetap ikut terbaca
+            if not os.path.exists(self.path):
+                self._loaded = True
+                return 0
+        total = 0
+        with open(self.path) as f:
+            while True:
+                with self._lock:
+                    added = self._read_new(f, batch_size)
+                    if added < batch_size:
+                        # Di bawah lock: add() sesudah ini sudah memakai jalur incremental
+                        self._loaded = True
+                total += added
+                if added < batch_size:
+                    return total
+
+    def _read_new(self, f, limit=None):
+        added = 0
+        f.seek(self._offset)
+        while limit is None or added < limit:
+            line = f.readline()
+            if not line.endswith('\n'):
+                break  # akhir file atau baris terakhir belum selesai ditulis
+            self._offset += len(line.encode())
+            value, nip, timestamp, unique_id = line.rstrip('\n').split('\t')
+            self._insert(int(value, 16) if value else None, (nip, timestamp, unique_id))
+            added += 1
+        return added
+
+    def _insert(self, value, meta):
+        # Tanpa Pillow hanya file_unique_id yang dicatat (value None)
+        if value is not None:
+            self._index.add(value, meta)
+        if meta[2]:
+            self._unique_ids[meta[2]] = meta
+
+    def add(self, value, nip, timestamp, unique_id=''):
+        meta = (nip, timestamp, unique_id)
+        line = f"{'' if value is None else format(value, '016x')}\t{nip}\t{timestamp}\t{unique_id}\n"
+        with self._lock, open(self.path, 'a+') as f:
+            if fcntl is not None:
+                # Baris dari proses lain dibaca dulu agar offset tetap sejajar dengan isi file
+                fcntl.flock(f, fcntl.LOCK_EX)
+            if not self._loaded:
+                # Riwayat belum dimuat: cukup tulis, load() yang sedang berjalan akan membacanya
+                f.write(line)
+                return
+            self._read_new(f)
+            f.write(line)
+            f.flush()
+            self._offset += len(line.encode())
+            self._insert(value, meta)
+
+    def _catch_up(self):
+        # Mode shared: baca entri dari proses lain, hanya setelah riwayat selesai dimuat
+        if self.shared and self._loaded:
+            self.load()
+
+    def find_by_unique_id(self, unique_id):
+        self._catch_up()
+        return self._unique_ids.get(unique_id)
+
+    def find_similar(self, value):
+        """Entri paling mirip (jarak, (nip, timestamp, unique_id)) atau None; aman dipanggil dari thread."""
+        self._catch_up()
+        with self._lock:
+            matches = self._index.search(value, self.max_distance)
+        return min(matches, key=lambda match: match[0]) if matches else None
+
+    async def hash_image(self, image_bytes):
+        if self._pool is None:
+            # spawn: fork saat thread lain (executor Sheets, journal) berjalan bisa deadlock di child
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, dhash, image_bytes)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: tanpa lock file, file profil hanya aman dipakai satu proses
+    fcntl = None
+
+
+# ====== Profil Perjalanan per User ======
+class Profile:
+    """Data perjalanan dari submission terakhir yang dikonfirmasi oleh satu user."""
+
+    __slots__ = ('nama', 'nip', 'tujuan', 'periode', 'periode_start', 'periode_end', 'updated')
+
+    # Field yang disalin dari/ke Session
+    _trip_fields = ('nama', 'nip', 'tujuan', 'periode', 'periode_start', 'periode_end')
+    _datetime_fields = ('periode_start', 'periode_end')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+
+    @classmethod
+    def from_session(cls, session):
+        profile = cls()
+        for name in cls._trip_fields:
+            setattr(profile, name, getattr(session, name))
+        profile.updated = time.time()
+        return profile
+
+    def apply(self, session):
+        for name in self._trip_fields:
+            setattr(session, name, getattr(self, name))
+
+    def is_active(self, today):
+        """Perjalanan masih berlaku jika tanggal selesainya belum lewat."""
+        return self.periode_end is not None and self.periode_end.date() >= today
+
+    def to_dict(self):
+        data = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if name in self._datetime_fields and value is not None:
+                value = value.isoformat()
+            data[name] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls()
+        for name in cls.__slots__:
+            value = data.get(name)
+            if name in cls._datetime_fields and value is not None:
+                value = datetime.fromisoformat(value)
+            setattr(profile, name, value)
+        return profile
+
+
+class ProfileStore:
+    """Profil terakhir per Telegram user id, disimpan ke file JSON lokal.
+
+    Perubahan hanya menandai store sebagai dirty; penulisan ke disk dilakukan
+    berkala (save_if_dirty) dan saat shutdown, bukan di setiap konfirmasi.
+    Di mode cluster file dipakai bersama: saat menyimpan, isi file digabung
+    (profil dengan `updated` terbaru yang dipakai) di bawah lock file.
+    """
+
+    def __init__(self, path, max_profiles=50000):
+        self.path = path
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def remember(self, user_id, session):
+        if session.periode_end is None:
+            return None
+        profile = Profile.from_session(session)
+        with self._lock:
+            self._profiles[user_id] = profile
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+            self._dirty = True
+        return profile
+
+    def active_trip(self, user_id, today=None):
+        """Profil user jika perjalanannya masih berlaku, selain itu None."""
+        profile = self._profiles.get(user_id)
+        if profile is None or not profile.is_active(today or datetime.now().date()):
+            return None
+        return profile
+
+    # ====== Simpan ke Disk ======
+    def save_if_dirty(self):
+        if not self.path:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = {str(user_id): profile.to_dict() for user_id, profile in self._profiles.items()}
+            self._dirty = False
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(self.path + '.lock', 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                data = self._merge_saved(data)
+                with open(tmp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+        except Exception:
+            self._dirty = True  # coba lagi di putaran berikutnya
+            raise
+        return True
+
+    def _merge_saved(self, data):
+        """Gabungkan dengan profil yang sudah ada di file (mis. ditulis worker lain)."""
+        if not os.path.exists(self.path):
+            return data
+        with open(self.path) as f:
+            saved = json.load(f)
+        for user_id, fields in saved.items():
+            current = data.get(user_id)
+            if current is None or (fields.get('updated') or 0) > (current.get('updated') or 0):
+                data[user_id] = fields
+        if len(data) > self.max_profiles:
+            newest = sorted(data.items(), key=lambda item: item[1].get('updated') or 0)[-self.max_profiles:]
+            data = dict(newest)
+        return data
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            data = json.load(f)
+        profiles = sorted(
+            ((int(user_id), Profile.from_dict(fields)) for user_id, fields in data.items()),
+            key=lambda item: item[1].updated or 0
+        )
+        with self._lock:
+            self._profiles = OrderedDict(profiles)
+        return len(profiles)
@@ -0,0 +1,63 @@
+import csv
+import threading
+
+
+def _normalize_key(key):
+    return str(key).strip().lower().replace(' ', '_')
+
+
+# ====== Roster Pegawai ======
+class RosterEntry:
+    __slots__ = ('nama', 'nip', 'telegram_id')
+
+    def __init__(self, nama, nip, telegram_id=None):
+        self.nama = nama
+        self.nip = nip
+        self.telegram_id = telegram_id
+
+
+class Roster:
+    """Daftar pegawai di memori, di-index per NIP dan per Telegram user id.
+
+    Record berasal dari worksheet Roster atau CSV lokal dengan kolom
+    `nama`, `nip` dan (opsional) `telegram_id`. Index dibangun ulang penuh
+    lalu ditukar sekaligus sehingga lookup tidak perlu dikunci.
+    """
+
+    def __init__(self):
+        self.by_nip = {}
+        self.by_user_id = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.by_nip)
+
+    def replace(self, records):
+        by_nip = {}
+        by_user_id = {}
+        for record in records:
+            record = {_normalize_key(key): str(value).strip() for key, value in record.items()}
+            nip = record.get('nip', '').replace(' ', '')
+            if not nip:
+                continue
+            telegram_id = record.get('telegram_id') or None
+            entry = RosterEntry(record.get('nama', ''), nip, int(telegram_id) if telegram_id else None)
+            by_nip[nip] = entry
+            if entry.telegram_id is not None:
+                by_user_id[entry.telegram_id] = entry
+        with self._lock:
+            self.by_nip, self.by_user_id = by_nip, by_user_id
+            self.loaded = True
+        return len(by_nip)
+
+    def lookup_nip(self, nip):
+        return self.by_nip.get(nip.replace(' ', ''))
+
+    def lookup_user(self, user_id):
+        return self.by_user_id.get(user_id)
+
+
+def read_roster_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
@@ -0,0 +1,49 @@
+"""Benchmark lookup raster mask wilayah dibandingkan dengan cek bounding box lama.
+
+Contoh:
+    python scripts/bench_land_mask.py --mask data/indonesia_mask.bin --lookups 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from land_mask import LandMask
+
+
+def bbox_check(lat, lon):
+    return -11 <= lat <= 6 and 95 <= lon <= 141
+
+
+def bench(name, fn, points):
+    started = time.perf_counter()
+    inside = sum(1 for lat, lon in points if fn(lat, lon))
+    elapsed = time.perf_counter() - started
+    print(f"{name:>10}: {elapsed / len(points) * 1e9:8.0f} ns/lookup, {inside / len(points):.1%} inside")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mask', default=os.path.join(ROOT, 'data', 'indonesia_mask.bin'))
+    parser.add_argument('--lookups', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    points = [(rng.uniform(-12, 7), rng.uniform(94, 142)) for _ in range(args.lookups)]
+
+    started = time.perf_counter()
+    mask = LandMask(args.mask)
+    print(f"Loaded {mask.rows}x{mask.cols} mask in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    bench('bbox', bbox_check, points)
+    bench('land mask', mask.contains, points)
+    mask.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark sinkronisasi dan query /rekap pada mirror Log dengan ratusan ribu baris.
+
+Contoh:
+    python scripts/bench_log_mirror.py --rows 300000 --employees 2000 --days 180
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from log_mirror import LogMirror, TIMESTAMP_FORMAT
+
+
+class FakeWorksheet:
+    """Worksheet tiruan yang melayani range A1 dari list baris di memori."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.reads = 0
+
+    def get(self, range_name):
+        self.reads += 1
+        start, end = range_name.split(':')
+        start, end = int(start[1:]), int(end[1:])
+        return self.rows[start - 1:end]
+
+
+def make_rows(count, employees, days, rng):
+    start = datetime.now() - timedelta(days=days)
+    rows = [['Timestamp', 'Nama', 'NIP', 'Tujuan', 'Periode', 'Agenda', 'Lat', 'Lon', 'Gmap', 'Foto', 'Status']]
+    step = days * 86400 / count
+    for i in range(count):
+        when = start + timedelta(seconds=i * step)
+        employee = rng.randrange(employees)
+        rows.append([
+            when.strftime(TIMESTAMP_FORMAT), f"Pegawai {employee}", f"1985{employee:014d}",
+            f"Kota {employee % 50}", '', 'Rapat', '-6.1', '106.8', '', '',
+            'Check-in' if i % 2 == 0 else 'Check-out'
+        ])
+    return rows
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(0.99 * (len(latencies) - 1))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=300000)
+    parser.add_argument('--employees', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--chunk', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    worksheet = FakeWorksheet(make_rows(args.rows, args.employees, args.days, rng))
+    mirror = LogMirror(chunk_size=args.chunk)
+
+    started = time.perf_counter()
+    while mirror.ingest('Log', worksheet.get(mirror.next_range('Log'))):
+        pass
+    print(f"Initial sync: {len(mirror)} rows in {worksheet.reads} range reads, {time.perf_counter() - started:.2f}s")
+
+    # Sinkronisasi berikutnya hanya membaca baris baru
+    worksheet.rows.extend(make_rows(100, args.employees, 0, rng)[1:])
+    reads = worksheet.reads
+    started = time.perf_counter()
+    while mirror.ingest('Log', worksheet.get(mirror.next_range('Log'))):
+        pass
+    print(f"Incremental sync: 100 rows in {worksheet.reads - reads} range read, {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    today = datetime.now().date()
+    nip = mirror.nip[rng.randrange(len(mirror))]
+    for label, fn in (
+        ('summary today', lambda: mirror.summary_on(today)),
+        ('rows by NIP', lambda: [mirror.record(i) for i in mirror.rows_for_nip(nip, limit=40)]),
+    ):
+        p50, p99 = timed(fn, 200)
+        print(f"{label}: p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark pencarian foto mirip dengan 100k hash tersimpan: BK-tree vs multi-index hash (dipakai bot).
+
+Contoh:
+    python scripts/bench_photo_hash.py --stored 100000 --queries 2000 --max-distance 6
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from photo_hash import BKTree, MultiIndexHash
+
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stored', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--max-distance', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = [rng.getrandbits(64) for _ in range(args.stored)]
+
+    # Setengah query adalah near-duplicate dari hash tersimpan, setengah lagi foto baru
+    queries = []
+    for i in range(args.queries):
+        if i % 2 == 0:
+            queries.append((flip_bits(rng.choice(hashes), rng.randint(0, args.max_distance), rng), True))
+        else:
+            queries.append((rng.getrandbits(64), False))
+
+    results = {}
+    for name, index in (('BK-tree', BKTree()), ('multi-index', MultiIndexHash(args.max_distance))):
+        started = time.perf_counter()
+        for i, value in enumerate(hashes):
+            index.add(value, i)
+        print(f"\n{name}: built with {len(index)} hashes in {time.perf_counter() - started:.2f}s")
+
+        latencies = []
+        found = 0
+        matches_per_query = []
+        for value, expected in queries:
+            started = time.perf_counter()
+            matches = index.search(value, args.max_distance)
+            latencies.append(time.perf_counter() - started)
+            found += bool(matches) and expected
+            matches_per_query.append(sorted(matches))
+        results[name] = matches_per_query
+
+        latencies.sort()
+        print(f"{len(queries)} queries, {found}/{args.queries // 2 + args.queries % 2} near-duplicates found")
+        for label, q in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            print(f"{label}: {latencies[int(q * (len(latencies) - 1))] * 1000:.3f} ms")
+        print(f"mean: {sum(latencies) / len(latencies) * 1000:.3f} ms")
+
+    print(f"\nHasil sama: {results['BK-tree'] == results['multi-index']}")
+
+if __name__ == '__main__':
+    main()
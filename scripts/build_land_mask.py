@@ -0,0 +1,42 @@
+"""Bangun raster bitmask wilayah Indonesia dari file batas wilayah (GeoJSON) lokal.
+
+Contoh:
+    python scripts/build_land_mask.py batas_indonesia.geojson --out data/indonesia_mask.bin
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from land_mask import dilate, load_geojson_rings, rasterize, write_mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('boundary', help='file GeoJSON (Polygon/MultiPolygon) batas wilayah')
+    parser.add_argument('--out', default=os.path.join(ROOT, 'data', 'indonesia_mask.bin'))
+    parser.add_argument('--resolution', type=float, default=0.01, help='ukuran sel dalam derajat (0.01 ~ 1.1 km)')
+    parser.add_argument('--bbox', default='-11.5,6.5,94.5,141.5', help='lat_min,lat_max,lon_min,lon_max')
+    parser.add_argument('--buffer-cells', type=int, default=1, help='perluasan area untuk toleransi garis pantai')
+    args = parser.parse_args()
+
+    lat_min, lat_max, lon_min, lon_max = (float(v) for v in args.bbox.split(','))
+
+    started = time.perf_counter()
+    rings = load_geojson_rings(args.boundary)
+    cells, rows, cols, lat_max, lon_max = rasterize(rings, lat_min, lat_max, lon_min, lon_max, args.resolution)
+    if args.buffer_cells:
+        cells = dilate(cells, rows, cols, args.buffer_cells)
+    write_mask(args.out, cells, lat_min, lat_max, lon_min, lon_max, rows, cols)
+
+    inside = cells.count(1)
+    print(f"{len(rings)} rings -> {rows}x{cols} grid, {inside} cells inside "
+          f"({inside / len(cells):.1%}), {os.path.getsize(args.out) / 1024:.0f} KB "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
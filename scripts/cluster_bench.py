@@ -0,0 +1,141 @@
+"""Benchmark mode cluster: generator update lokal mengirim alur check-in lengkap ke front webhook cluster.py.
+
+Worker memakai Bot API dan worksheet palsu dari scripts/loadtest.py dan backend SQLite bersama,
+jadi tidak butuh jaringan atau kredensial. Bandingkan throughput dengan jumlah worker berbeda.
+Generator memakai koneksi keep-alive asyncio mentah (satu alur user per koneksi pada satu waktu)
+agar biaya client HTTP tidak ikut terukur sebagai latency front.
+
+Contoh:
+    python scripts/cluster_bench.py --workers 1 --users 300
+    python scripts/cluster_bench.py --workers 4 --users 300 --api-latency 0.05
+    # Worker dibatasi latency Bot API (bukan CPU), misalnya pada mesin satu core
+    UPDATE_CONCURRENCY=4 python scripts/cluster_bench.py --workers 4 --users 200 --api-latency 0.2
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cluster import Cluster, ClusterFront, ClusterStore
+from loadtest import UpdateFactory, configure_worker
+from storage import SQLiteStorage
+
+
+async def post(reader, writer, path, payload):
+    """Satu request POST di koneksi keep-alive; kembalikan status HTTP."""
+    body = json.dumps(payload).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def send_flows(port, path, flows, latencies):
+    # Update satu user dikirim berurutan, seperti Telegram untuk satu chat
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        while not flows.empty():
+            user_id, rng = flows.get_nowait()
+            for _, payload in UpdateFactory(user_id).flow(rng):
+                started = time.perf_counter()
+                status = await post(reader, writer, path, payload)
+                if status != 200:
+                    raise RuntimeError(f"webhook status {status}")
+                latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run(args, cluster):
+    store = ClusterStore(cluster.store_path)
+    front = ClusterFront(cluster.queues, store, '127.0.0.1', args.port, 'telegram')
+    await front.start()
+    path = '/telegram'
+
+    while cluster.ready.value < args.workers:
+        await asyncio.sleep(0.1)
+
+    rng = random.Random(args.seed)
+    latencies = []
+    total = args.users * len(UpdateFactory(0).flow(rng))
+    flows = asyncio.Queue()
+    for i in range(args.users):
+        flows.put_nowait((10_000 + i, random.Random(rng.random())))
+    started = time.perf_counter()
+    await asyncio.gather(*(send_flows(args.port, path, flows, latencies) for _ in range(args.connections)))
+    accepted = time.perf_counter() - started
+    while cluster.processed.value < total and time.perf_counter() - started < args.timeout:
+        await asyncio.sleep(0.02)
+    processed = time.perf_counter() - started
+
+    # Webhook yang dikirim ulang Telegram harus dibuang oleh front
+    reader, writer = await asyncio.open_connection('127.0.0.1', args.port)
+    await post(reader, writer, path, UpdateFactory(10_000).text('/start') | {'update_id': 1_000_001})
+    writer.close()
+    await writer.wait_closed()
+
+    latencies.sort()
+    print(f"\n{args.workers} workers, {args.users} users, {total} updates")
+    print(f"Front accepted all updates in {accepted:.2f}s ({total / accepted:.0f} updates/s), "
+          f"webhook p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(0.99 * (len(latencies) - 1))] * 1000:.1f} ms")
+    print(f"Workers processed {cluster.processed.value}/{total} updates in {processed:.2f}s "
+          f"({cluster.processed.value / processed:.0f} updates/s, {args.users / processed:.1f} check-ins/s)")
+    print(f"Routed per worker: {front.routed}, duplicates dropped: {front.duplicates}")
+    await front.stop()
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--connections', type=int, default=40, help='koneksi webhook paralel (maks. Telegram: 100)')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='latency tiap panggilan Bot API palsu (detik)')
+    parser.add_argument('--sheet-latency', type=float, default=0.3, help='latency tiap panggilan worksheet palsu (detik)')
+    parser.add_argument('--port', type=int, default=18443)
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # Worker mewarisi environment ini; file bersama (journal, hash foto, storage) ditaruh di direktori sementara
+    workdir = tempfile.mkdtemp(prefix='cluster-bench-')
+    os.environ.setdefault('GOOGLE_CREDS_JSON', '{}')
+    os.environ['JOURNAL_PATH'] = os.path.join(workdir, 'journal.db')
+    os.environ['PHOTO_HASH_PATH'] = os.path.join(workdir, 'photo_hashes.tsv')
+    os.environ['PROFILE_PATH'] = ''
+    os.environ['METRICS_PORT'] = '0'
+    os.environ['STORAGE_BACKEND'] = 'sqlite'
+    os.environ['STORAGE_PATH'] = os.path.join(workdir, 'storage.db')
+    os.environ.setdefault('NOTIFY_RATE_PER_MINUTE', '1000000')
+    os.environ.setdefault('SHEET_BATCH_DELAY', '0.2')
+
+    store_path = os.path.join(workdir, 'cluster.db')
+    ClusterStore(store_path).close()
+    cluster = Cluster(args.workers, store_path, configure=functools.partial(configure_worker, args.api_latency, args.sheet_latency))
+    cluster.start()
+    try:
+        asyncio.run(run(args, cluster))
+    finally:
+        cluster.stop()
+    print(f"Rows in shared SQLite storage: {len(SQLiteStorage(os.environ['STORAGE_PATH']))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Ekspor worksheet Log (atau journal / storage SQLite lokal) ke CSV/Parquet per potongan, dengan memori terbatas.
+
+Contoh:
+    python scripts/export.py --out log_2026_10.csv --from 2026-10-01 --to 2026-10-31
+    python scripts/export.py --source journal --journal journal.db --out log.csv --nip 198501012010011001
+    python scripts/export.py --format parquet --out log_parquet/ --resume
+    python scripts/export.py --source sqlite --storage-db storage.db --out log.csv
+
+Dari Sheets, worksheet Log lama dibaca bersama shard bulanan (Log_YYYY_MM, lihat --index-sheet)
+yang bulannya masuk rentang --from/--to saja.
+
+Progress disimpan ke <out>.progress.json setelah setiap potongan; --resume melanjutkan
+dari potongan terakhir yang selesai.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+
+from export_log import CsvSink, ParquetSink, export, filter_rows, journal_chunks, load_progress, sheet_chunks
+from sheets import MonthlyShards, SheetHandle
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+def open_sheet(args):
+    def authorize():
+        if args.creds:
+            creds = ServiceAccountCredentials.from_json_keyfile_name(args.creds, SCOPE)
+        else:
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(os.environ['GOOGLE_CREDS_JSON']), SCOPE)
+        client = gspread.authorize(creds)
+        client.set_timeout(args.timeout)
+        return client
+
+    return SheetHandle(authorize, args.spreadsheet, args.sheet)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', choices=('sheet', 'journal', 'sqlite'), default='sheet')
+    parser.add_argument('--out', required=True, help='file CSV atau direktori Parquet')
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='tanggal awal (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='tanggal akhir (YYYY-MM-DD)')
+    parser.add_argument('--nip')
+    parser.add_argument('--chunk', type=int, default=5000, help='jumlah baris per potongan')
+    parser.add_argument('--resume', action='store_true')
+    parser.add_argument('--creds', help='file JSON service account (default: env GOOGLE_CREDS_JSON)')
+    parser.add_argument('--spreadsheet', default='MonitoringDinas')
+    parser.add_argument('--sheet', default='Log')
+    parser.add_argument('--index-sheet', default='Log_Index', help="index shard bulanan ('' = tanpa shard)")
+    parser.add_argument('--journal', default='journal.db')
+    parser.add_argument('--storage-db', default='storage.db', help='database STORAGE_BACKEND=sqlite')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    progress_path = args.out.rstrip('/') + '.progress.json'
+    options = {
+        'source': args.source, 'format': args.format, 'chunk': args.chunk, 'nip': args.nip, 'sheet': args.sheet,
+        'from': args.date_from and args.date_from.isoformat(), 'to': args.date_to and args.date_to.isoformat(),
+    }
+    progress = load_progress(progress_path) if args.resume else None
+    if progress is not None and progress['options'] != options:
+        parser.error(f"opsi berbeda dengan progress di {progress_path}, jalankan ulang tanpa --resume")
+    if progress is None:
+        progress = {'options': options, 'cursor': None, 'chunks': 0, 'rows': 0, 'size': None}
+    else:
+        print(f"Resuming after chunk {progress['chunks']} ({progress['rows']} rows written)")
+
+    sink_class = ParquetSink if args.format == 'parquet' else CsvSink
+    try:
+        sink = sink_class(args.out, resume_size=progress['size'] if progress['chunks'] else None)
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    if args.source == 'sheet':
+        handle = open_sheet(args)
+        sheet_names = [args.sheet]
+        if args.index_sheet:
+            # Worksheet Log lama + shard bulanan yang beririsan dengan rentang tanggal
+            shards = MonthlyShards(handle, args.sheet, args.index_sheet, None)
+            sheet_names += shards.names_between(args.date_from, args.date_to)
+        chunks = sheet_chunks(handle, sheet_names, args.chunk, start=progress['cursor'])
+    elif args.source == 'sqlite':
+        from storage import SQLiteStorage
+        chunks = SQLiteStorage(args.storage_db).stream(args.chunk, start=progress['cursor'])
+    else:
+        from journal import Journal
+        chunks = journal_chunks(Journal(args.journal), args.chunk, after_id=progress['cursor'] or 0)
+
+    started = time.perf_counter()
+    try:
+        for state in export(filter_rows(chunks, args.date_from, args.date_to, args.nip), sink, progress_path, progress):
+            print(f"chunk {state['chunks']}: {state['rows']} rows, cursor {state['cursor']}")
+    finally:
+        sink.close()
+    print(f"Exported {progress['rows']} rows to {args.out} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""Load test offline: jalankan ConversationHandler dari main.py dengan update sintetis untuk N user.
+
+Setiap user menjalani alur lengkap /start -> check-in -> nama -> NIP -> tujuan -> kalender
+(mulai & selesai) -> agenda -> lokasi -> foto -> konfirmasi_simpan. Bot API Telegram dan
+worksheet Google Sheets diganti versi palsu dengan latency yang bisa diatur, jadi tidak
+butuh jaringan atau kredensial.
+
+Contoh:
+    python scripts/loadtest.py --users 500 --api-latency 0.05 --sheet-latency 0.3
+    python scripts/loadtest.py --users 2000 --ramp 10 --trace-memory
+    python scripts/loadtest.py --users 2000 --storage tee
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+from storage import SheetsStorage
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# ====== Bot API & Worksheet Palsu ======
+def fake_jpeg(seed):
+    if Image is None:
+        return b''
+    rng = random.Random(seed)
+    image = Image.new('L', (64, 48))
+    image.putdata([rng.randrange(256) for _ in range(64 * 48)])
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Pengganti koneksi HTTP ke Bot API: setiap panggilan menunggu `latency` lalu membalas sukses."""
+
+    read_timeout = None
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = {}
+        self.rejections = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if '/file/' in url:
+            return 200, fake_jpeg(url.rsplit('/', 1)[-1])
+
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        text = params.get('text') or params.get('caption') or ''
+        if text.startswith('❌'):
+            self.rejections += 1
+
+        if endpoint == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'loadtest', 'username': 'loadtest_bot'}
+        elif endpoint in ('sendMessage', 'editMessageText', 'sendPhoto'):
+            chat_id = str(params.get('chat_id', '1'))
+            result = {
+                'message_id': 1, 'date': int(time.time()), 'text': text,
+                'chat': {'id': int(chat_id) if chat_id.lstrip('-').isdigit() else 1, 'type': 'private'},
+            }
+        elif endpoint == 'getFile':
+            result = {'file_id': params['file_id'], 'file_unique_id': 'x', 'file_path': f"photos/{params['file_id']}.jpg"}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+class FakeWorksheet:
+    def __init__(self, rows, latency):
+        self.rows = rows
+        self.latency = latency
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)  # dijalankan di thread pool SheetExecutor, seperti gspread
+
+    def append_rows(self, rows, **kwargs):
+        self._wait()
+        self.rows.extend(rows)
+
+    def append_row(self, row, **kwargs):
+        self._wait()
+        self.rows.append(row)
+
+    def get(self, range_name):
+        self._wait()
+        start, end = (int(part[1:]) for part in range_name.split(':'))
+        return self.rows[start - 1:end]
+
+    def get_all_values(self):
+        self._wait()
+        return list(self.rows)
+
+    def get_all_records(self):
+        self._wait()
+        return []
+
+
+class FakeSheetHandle:
+    """Pengganti SheetHandle: worksheet di memori, dibuat otomatis saat diminta."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.sheets = {}
+
+    def get(self, sheet_name=None):
+        return FakeWorksheet(self.sheets.setdefault(sheet_name or 'Log', []), self.latency)
+
+    def ensure(self, sheet_name, header=None, rows=1000):
+        if sheet_name not in self.sheets and header:
+            self.sheets[sheet_name] = [header]
+        return self.get(sheet_name)
+
+    def call(self, fn, sheet_name=None):
+        return fn(self.get(sheet_name))
+
+    def data_rows(self, header):
+        return sum(
+            1 for name, rows in self.sheets.items() if name.startswith('Log') and name != 'Log_Index'
+            for row in rows if row != header
+        )
+
+
+# ====== Alur per User ======
+class UpdateFactory:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'}
+        self.ids = itertools.count(user_id * 100)
+
+    def _message(self, **fields):
+        message = {
+            'message_id': next(self.ids), 'date': int(time.time()),
+            'chat': {'id': self.user_id, 'type': 'private'}, 'from': self.user,
+        }
+        message.update(fields)
+        return {'update_id': next(self.ids), 'message': message}
+
+    def text(self, text):
+        fields = {'text': text}
+        if text.startswith('/'):
+            fields['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        return self._message(**fields)
+
+    def callback(self, data):
+        return {'update_id': next(self.ids), 'callback_query': {
+            'id': str(next(self.ids)), 'from': self.user, 'chat_instance': str(self.user_id), 'data': data,
+            'message': {'message_id': next(self.ids), 'date': int(time.time()),
+                        'chat': {'id': self.user_id, 'type': 'private'}, 'text': 'x'},
+        }}
+
+    def flow(self, rng):
+        nip = f"1985{self.user_id:014d}"
+        lat = -6.2 + rng.uniform(-0.05, 0.05)
+        lon = 106.8 + rng.uniform(-0.05, 0.05)
+        photo = {'file_id': f'photo{self.user_id}', 'file_unique_id': f'unique{self.user_id}',
+                 'width': 1200, 'height': 1600, 'file_size': 250000}
+        return [
+            ('start', self.text('/start')),
+            ('start_checkin', self.callback('start_checkin')),
+            ('nama', self.text('Budi Santoso')),
+            ('nip', self.text(nip)),
+            ('tujuan', self.text('Makassar')),
+            ('periode_start', self.callback('today')),
+            ('periode_end', self.callback('today')),
+            ('agenda', self.text('Rapat koordinasi')),
+            ('lokasi', self._message(location={'latitude': round(lat, 6), 'longitude': round(lon, 6)})),
+            ('foto', self._message(photo=[photo])),
+            ('konfirmasi', self.callback('konfirmasi_simpan')),
+        ]
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_user(app, user_id, delay, think, latencies, rng):
+    await asyncio.sleep(delay)
+    for state, payload in UpdateFactory(user_id).flow(rng):
+        update = Update.de_json(payload, app.bot)
+        started = time.perf_counter()
+        # Lewat update processor yang sama dengan produksi (lock per user + batas konkurensi)
+        await app.update_processor.process_update(update, app.process_update(update))
+        latencies.setdefault(state, []).append(time.perf_counter() - started)
+        if think:
+            await asyncio.sleep(rng.uniform(0, think))
+
+
+def install_fakes(main, api_latency, sheet_latency):
+    """Ganti semua akses Sheets di modul main dengan worksheet palsu; kembalikan (request Bot API palsu, handle)."""
+    request = FakeTelegramRequest(api_latency)
+    handle = FakeSheetHandle(sheet_latency)
+    main.sheet_handle = handle
+    if main.log_shards is not None:
+        main.log_shards.handle = handle
+    for backend in (main.storage, main.shipping_storage):
+        if isinstance(backend, SheetsStorage):
+            backend.handle = handle
+    return request, handle
+
+
+def configure_worker(api_latency, sheet_latency, main):
+    """Hook `configure` untuk worker cluster.py (lihat scripts/cluster_bench.py)."""
+    request, _ = install_fakes(main, api_latency, sheet_latency)
+    return Application.builder().token('123:loadtest').request(request)
+
+
+async def run(args, main):
+    request, handle = install_fakes(main, args.api_latency, args.sheet_latency)
+    app = main.build_application(
+        Application.builder().token('123:loadtest').request(request).get_updates_request(FakeTelegramRequest(0))
+    )
+    await app.initialize()
+    await app.post_init(app)
+
+    rng = random.Random(args.seed)
+    latencies = {}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_user(app, 10_000 + i, args.ramp * i / args.users, args.think, latencies, random.Random(rng.random()))
+        for i in range(args.users)
+    ))
+    elapsed = time.perf_counter() - started
+
+    # Tunggu semua baris sampai ke worksheet palsu
+    while main.journal.unshipped_count() and time.perf_counter() - started < elapsed + args.drain_timeout:
+        await asyncio.sleep(0.05)
+    durable = time.perf_counter() - started
+
+    sheet_rows = handle.data_rows(main.LOG_HEADER)
+    stored_rows = sheet_rows if main.storage.remote else len(main.storage)
+    await app.post_shutdown(app)
+    await app.shutdown()
+
+    updates = sum(len(values) for values in latencies.values())
+    print(f"\n{args.users} users, {updates} updates in {elapsed:.2f}s "
+          f"({args.users / elapsed:.1f} check-ins/s, {updates / elapsed:.1f} updates/s)")
+    print(f"Rows in {args.storage} storage: {stored_rows}, in fake sheet: {sheet_rows} "
+          f"(all shipped after {durable:.2f}s), rejected replies: {request.rejections}")
+    print(f"\n{'state':<15}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for state, values in latencies.items():
+        values.sort()
+        print(f"{state:<15}{len(values):>7}" + ''.join(
+            f"{percentile(values, q) * 1000:>10.1f}" for q in (0.50, 0.95, 0.99)
+        ) + f"{values[-1] * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--ramp', type=float, default=0.0, help='detik untuk memulai semua user (0 = serentak)')
+    parser.add_argument('--think', type=float, default=0.0, help='jeda acak maksimal antar langkah per user (detik)')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='latency tiap panggilan Bot API palsu (detik)')
+    parser.add_argument('--sheet-latency', type=float, default=0.3, help='latency tiap panggilan worksheet palsu (detik)')
+    parser.add_argument('--storage', choices=('sheets', 'sqlite', 'memory', 'tee'), default='sheets')
+    parser.add_argument('--drain-timeout', type=float, default=60.0)
+    parser.add_argument('--trace-memory', action='store_true', help='ukur puncak alokasi Python dengan tracemalloc')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # State lokal (journal, index foto) ditulis ke direktori sementara; fitur persisten lain dimatikan
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    os.environ.setdefault('GOOGLE_CREDS_JSON', '{}')
+    os.environ['JOURNAL_PATH'] = os.path.join(workdir, 'journal.db')
+    os.environ['PHOTO_HASH_PATH'] = os.path.join(workdir, 'photo_hashes.tsv')
+    os.environ['SESSION_SNAPSHOT_PATH'] = ''
+    os.environ['PROFILE_PATH'] = ''
+    os.environ['STORAGE_BACKEND'] = args.storage
+    os.environ['STORAGE_PATH'] = os.path.join(workdir, 'storage.db')
+    os.environ['METRICS_PORT'] = '0'
+    os.environ.setdefault('NOTIFY_RATE_PER_MINUTE', '1000000')
+    os.environ.setdefault('SHEET_BATCH_DELAY', '0.2')
+
+    if args.trace_memory:
+        tracemalloc.start()
+    import main as bot_main
+    asyncio.run(run(args, bot_main))
+
+    print(f"\nPeak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    if args.trace_memory:
+        print(f"Peak Python allocations (tracemalloc): {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Kirim update Telegram sintetis ke webhook bot yang berjalan lokal.
+
+Contoh:
+    BOT_MODE=webhook WEBHOOK_PORT=8443 WEBHOOK_SECRET=rahasia python main.py
+    python scripts/post_update.py --port 8443 --secret rahasia --text /start --users 50
+"""
+import argparse
+import itertools
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def build_message_update(update_id, user_id, text):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def post_update(url, secret, payload, timeout=10):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    if secret:
+        request.add_header('X-Telegram-Bot-Api-Secret-Token', secret)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--path', default='telegram')
+    parser.add_argument('--secret', default=None)
+    parser.add_argument('--text', default='/start')
+    parser.add_argument('--users', type=int, default=1, help='jumlah user sintetis')
+    parser.add_argument('--repeat', type=int, default=1, help='jumlah update per user')
+    parser.add_argument('--first-user-id', type=int, default=100000)
+    parser.add_argument('--parallel', type=int, default=16)
+    args = parser.parse_args()
+
+    url = f"http://{args.host}:{args.port}/{args.path.lstrip('/')}"
+    update_ids = itertools.count(int(time.time()))
+    payloads = [
+        build_message_update(next(update_ids), args.first_user_id + user, args.text)
+        for _ in range(args.repeat)
+        for user in range(args.users)
+    ]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.parallel) as pool:
+        statuses = list(pool.map(lambda payload: post_update(url, args.secret, payload), payloads))
+    elapsed = time.perf_counter() - started
+
+    ok = sum(1 for status in statuses if status == 200)
+    print(f"Posted {len(payloads)} updates to {url}: {ok} OK in {elapsed:.2f}s "
+          f"({len(payloads) / elapsed:.1f} updates/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+# ====== Data Form per User ======
+class Session:
+    """Draft form satu user. Memakai __slots__ agar ringkas di memori."""
+
+    __slots__ = (
+        'status', 'nama', 'nip', 'tujuan', 'periode', 'periode_start', 'periode_end', 'agenda',
+        'lat', 'lon', 'geofence', 'location_timestamp', 'foto_file_id', 'foto',
+        'foto_unique_id', 'foto_hash', 'foto_task', 'foto_timestamp', 'foto_size',
+        'foto_resolution', 'touched'
+    )
+
+    # Field bertipe datetime yang perlu dikonversi saat snapshot
+    _datetime_fields = ('periode_start', 'periode_end')
+    # Field yang hanya hidup di proses ini (tidak ikut snapshot)
+    _transient_fields = ('foto_task',)
+
+    def __init__(self, status=None):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.status = status
+        self.touched = time.time()
+
+    def to_dict(self):
+        data = {}
+        for name in self.__slots__:
+            if name in self._transient_fields:
+                continue
+            value = getattr(self, name)
+            if name in self._datetime_fields and value is not None:
+                value = value.isoformat()
+            data[name] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls()
+        for name in cls.__slots__:
+            value = data.get(name)
+            if name in cls._datetime_fields and value is not None:
+                value = datetime.fromisoformat(value)
+            setattr(session, name, value)
+        if session.touched is None:
+            session.touched = time.time()
+        return session
+
+    def approx_size(self):
+        return sys.getsizeof(self) + sum(sys.getsizeof(getattr(self, name)) for name in self.__slots__)
+
+
+# ====== Session Store ======
+class SessionStore:
+    """Penyimpanan draft form dengan batas ukuran (LRU) dan TTL untuk draft yang ditinggal.
+
+    Jika snapshot_path diisi, isi store bisa disimpan ke disk dan dimuat lagi saat
+    startup sehingga user yang sedang mengisi form tidak perlu mengulang setelah restart.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=6 * 3600, snapshot_path=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted_ttl = 0
+        self.evicted_lru = 0
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, user_id):
+        """Ambil session aktif (None jika tidak ada atau sudah kedaluwarsa)."""
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                return None
+            now = time.time()
+            if now - session.touched > self.ttl:
+                del self._sessions[user_id]
+                self.evicted_ttl += 1
+                return None
+            session.touched = now
+            self._sessions.move_to_end(user_id)
+            return session
+
+    def start(self, user_id, status=None):
+        """Mulai draft baru untuk user (menggantikan draft lama jika ada)."""
+        session = Session(status)
+        with self._lock:
+            self._sessions[user_id] = session
+            self._sessions.move_to_end(user_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted_lru += 1
+        return session
+
+    def pop(self, user_id):
+        with self._lock:
+            return self._sessions.pop(user_id, None)
+
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [user_id for user_id, session in self._sessions.items() if session.touched < cutoff]
+            for user_id in expired:
+                del self._sessions[user_id]
+            self.evicted_ttl += len(expired)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            count = len(self._sessions)
+            approx_bytes = sys.getsizeof(self._sessions) + sum(
+                sys.getsizeof(user_id) + session.approx_size() for user_id, session in self._sessions.items()
+            )
+        return {
+            'sessions': count,
+            'capacity': self.max_sessions,
+            'occupancy': count / self.max_sessions if self.max_sessions else 0.0,
+            'approx_bytes': approx_bytes,
+            'evicted_ttl': self.evicted_ttl,
+            'evicted_lru': self.evicted_lru,
+        }
+
+    # ====== Snapshot ======
+    def dump(self):
+        """Isi store sebagai dict user_id -> dict (untuk snapshot ke disk atau store cluster)."""
+        with self._lock:
+            return {user_id: session.to_dict() for user_id, session in self._sessions.items()}
+
+    def restore(self, data):
+        """Muat session dari hasil dump(); kembalikan jumlah session yang masih berlaku."""
+        with self._lock:
+            for user_id, fields in data.items():
+                self._sessions[int(user_id)] = Session.from_dict(fields)
+        # Buang draft yang sudah kedaluwarsa selama bot mati
+        self.evict_expired()
+        return len(self._sessions)
+
+    def save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        data = self.dump()
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        with open(self.snapshot_path) as f:
+            return self.restore(json.load(f))
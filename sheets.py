@@ -0,0 +1,247 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import gspread
+
+
+def _utcnow():
+    # google-auth menyimpan expiry token sebagai datetime UTC naive
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ====== Worksheet Handle ======
+class SheetHandle:
+    """Handle worksheet yang di-resolve sekali lalu dipakai bersama oleh semua handler.
+
+    Spreadsheet hanya di-resolve ulang jika token tidak berlaku lagi (401/403) atau
+    spreadsheet tidak ditemukan (404); worksheet yang hilang hanya dikeluarkan dari cache. Token OAuth client di-refresh lebih dulu
+    sebelum kedaluwarsa sehingga setiap penyimpanan cukup satu panggilan API.
+    Worksheet lain di spreadsheet yang sama (mis. Roster) bisa diminta lewat sheet_name.
+    """
+
+    def __init__(self, authorize, spreadsheet_name, sheet_name, refresh_margin=300):
+        self._authorize = authorize
+        self.spreadsheet_name = spreadsheet_name
+        self.sheet_name = sheet_name
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._client = None
+        self._spreadsheet = None
+        self._worksheets = {}
+        self._lock = threading.Lock()
+
+    def _refresh_token_if_needed(self):
+        expiry = self._client.expiry
+        if expiry is None or expiry - _utcnow() < self.refresh_margin:
+            self._client.http_client.login()
+
+    def get(self, sheet_name=None):
+        """Kembalikan worksheet yang sudah di-cache (resolve jika belum ada)."""
+        sheet_name = sheet_name or self.sheet_name
+        with self._lock:
+            if self._client is None:
+                self._client = self._authorize()
+            self._refresh_token_if_needed()
+            if self._spreadsheet is None:
+                self._spreadsheet = self._client.open(self.spreadsheet_name)
+            worksheet = self._worksheets.get(sheet_name)
+            if worksheet is None:
+                worksheet = self._worksheets[sheet_name] = self._spreadsheet.worksheet(sheet_name)
+            return worksheet
+
+    def ensure(self, sheet_name, header=None, rows=1000):
+        """Seperti get(), tetapi worksheet dibuat (beserta header) jika belum ada."""
+        try:
+            return self.get(sheet_name)
+        except gspread.exceptions.WorksheetNotFound:
+            pass
+        with self._lock:
+            try:
+                worksheet = self._spreadsheet.add_worksheet(sheet_name, rows=rows, cols=len(header) if header else 26)
+            except gspread.exceptions.APIError as e:
+                # Proses lain (worker cluster) baru saja membuatnya: pakai yang sudah ada, header sudah ditulis
+                try:
+                    worksheet = self._spreadsheet.worksheet(sheet_name)
+                except gspread.exceptions.WorksheetNotFound:
+                    raise e from None
+            else:
+                if header:
+                    worksheet.append_row(header)
+            self._worksheets[sheet_name] = worksheet
+            return worksheet
+
+    def invalidate(self, reauthorize=False):
+        with self._lock:
+            self._spreadsheet = None
+            self._worksheets.clear()
+            if reauthorize:
+                self._client = None
+
+    def forget(self, sheet_name):
+        with self._lock:
+            self._worksheets.pop(sheet_name, None)
+
+    def call(self, fn, sheet_name=None):
+        """Jalankan fn(worksheet); resolve ulang dan coba sekali lagi jika handle basi."""
+        sheet_name = sheet_name or self.sheet_name
+        cached = sheet_name in self._worksheets
+        try:
+            return fn(self.get(sheet_name))
+        except gspread.exceptions.WorksheetNotFound:
+            # Hanya worksheet ini yang hilang (mis. Roster opsional): spreadsheet dan worksheet lain
+            # tetap di-cache. Jika belum pernah di-resolve, worksheet memang tidak ada.
+            if not cached:
+                raise
+            self.forget(sheet_name)
+        except gspread.exceptions.SpreadsheetNotFound:
+            self.invalidate()
+        except gspread.exceptions.APIError as e:
+            if e.code in (401, 403):
+                self.invalidate(reauthorize=True)
+            elif e.code == 404:
+                self.invalidate()
+            else:
+                raise
+        return fn(self.get(sheet_name))
+
+
+# ====== Worksheet per Bulan ======
+class MonthlyShards:
+    """Routing baris Log ke worksheet per bulan (mis. Log_2026_10) yang dibuat saat dibutuhkan.
+
+    Daftar shard dicatat di worksheet index kecil sehingga pembaca cukup membuka
+    shard yang bulannya masuk rentang tanggal yang diminta. Semua method bersifat
+    blocking dan dijalankan lewat SheetExecutor.
+    """
+
+    INDEX_HEADER = ['shard', 'bulan', 'dibuat']
+
+    def __init__(self, handle, prefix, index_sheet, header):
+        self.handle = handle
+        self.prefix = prefix
+        self.index_sheet = index_sheet
+        self.header = header
+        self._shards = None
+        self._lock = threading.Lock()
+
+    def shard_name(self, timestamp):
+        """'2026-10-17 08:00:00' -> 'Log_2026_10'"""
+        return f"{self.prefix}_{timestamp[:4]}_{timestamp[5:7]}"
+
+    def _load_index(self):
+        """Baca index tanpa membuatnya; index yang belum ada (belum ada shard) dianggap kosong.
+
+        Baris ganda untuk bulan yang sama (dua proses membuat shard bersamaan) diabaikan, baris pertama dipakai.
+        """
+        try:
+            values = self.handle.call(lambda sheet: sheet.get_all_values(), self.index_sheet)
+        except gspread.exceptions.WorksheetNotFound:
+            return {}
+        shards = {}
+        for row in values[1:]:
+            if len(row) >= 2 and row[0]:
+                shards.setdefault(row[1], row[0])
+        return shards
+
+    def shards(self):
+        """Dict 'YYYY-MM' -> nama worksheet, dibaca dari index sekali lalu di-cache."""
+        with self._lock:
+            if self._shards is None:
+                self._shards = self._load_index()
+            return dict(self._shards)
+
+    def refresh(self):
+        with self._lock:
+            self._shards = None
+        return self.shards()
+
+    def ensure(self, timestamp):
+        """Pastikan shard untuk timestamp ada (buat + catat di index jika belum); kembalikan namanya.
+
+        Dalam satu proses diserialisasi oleh lock; antar proses index dibaca ulang sesaat sebelum
+        dicatat sehingga bulan yang sudah dicatat proses lain tidak ditambahkan lagi.
+        """
+        month = timestamp[:7]
+        with self._lock:
+            if self._shards is None:
+                self._shards = self._load_index()
+            name = self._shards.get(month)
+            if name is None:
+                name = self.shard_name(timestamp)
+                self.handle.ensure(name, header=self.header)
+                # Worksheet index hanya dibuat di jalur tulis, pembaca (export, /rekap) tidak membuatnya
+                self.handle.ensure(self.index_sheet, header=self.INDEX_HEADER)
+                self._shards = self._load_index()
+                if month not in self._shards:
+                    self.handle.call(
+                        lambda sheet: sheet.append_row([name, month, _utcnow().isoformat(timespec='seconds')]),
+                        self.index_sheet
+                    )
+                    self._shards[month] = name
+                name = self._shards[month]
+            return name
+
+    def append_rows(self, timestamp, rows):
+        name = self.ensure(timestamp)
+        return self.handle.call(lambda sheet: sheet.append_rows(rows), name)
+
+    def names_between(self, date_from=None, date_to=None):
+        """Nama shard yang bulannya beririsan dengan rentang tanggal, urut dari yang terlama."""
+        low = date_from.strftime('%Y-%m') if date_from else ''
+        high = date_to.strftime('%Y-%m') if date_to else '9999-99'
+        return [name for month, name in sorted(self.shards().items()) if low <= month <= high]
+
+
+# ====== Executor untuk I/O gspread ======
+class SheetExecutor:
+    """Jalankan panggilan gspread/oauth2client (blocking) di thread pool terbatas.
+
+    Jumlah worker dan jumlah panggilan bersamaan dibatasi, dan setiap panggilan
+    punya timeout sehingga request Google yang macet menjadi error biasa yang
+    bisa dicoba ulang, bukan bot yang membeku.
+    """
+
+    def __init__(self, max_workers=4, max_concurrency=None, timeout=30.0, observe=None):
+        self.timeout = timeout
+        # observe(detik, hasil) dipanggil setelah setiap panggilan; hasil 'ok', 'timeout' atau nama exception
+        self.observe = observe
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sheets')
+        self._semaphore = asyncio.Semaphore(max_concurrency or max_workers)
+
+    async def run(self, fn, *args, timeout=None, settle=False, **kwargs):
+        """Jalankan fn di thread pool.
+
+        Thread tidak bisa dihentikan saat timeout, jadi panggilan yang tidak idempotent (append)
+        memakai settle=True: setelah timeout tetap ditunggu sampai thread selesai (dibatasi timeout
+        HTTP client) dan hasil sebenarnya yang dikembalikan, sehingga pemanggil tidak mencoba
+        ulang penulisan yang ternyata berhasil.
+        """
+        timeout = timeout or self.timeout
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            outcome = 'ok'
+            future = loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.CancelledError:
+                outcome = 'cancelled'
+                raise
+            except asyncio.TimeoutError:
+                outcome = 'timeout'
+                if settle:
+                    print(f"Google Sheets call exceeded {timeout:g}s, waiting for it to finish")
+                    return await future
+                raise TimeoutError(f"Google Sheets call timed out after {timeout:g}s") from None
+            except Exception as e:
+                outcome = type(e).__name__
+                raise
+            finally:
+                if self.observe is not None:
+                    self.observe(time.perf_counter() - started, outcome)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,223 @@
+import json
+import sqlite3
+import threading
+
+from export_log import filter_rows, sheet_chunks
+from log_mirror import normalize_nip
+
+
+# ====== Backend Penyimpanan Log ======
+# Setiap backend menyediakan method blocking yang sama:
+#   append_rows(rows)                          tambah satu batch baris Log
+#   query(date_from, date_to, nip, limit)      baris yang cocok, urut dari yang terlama
+#   stream(chunk_size, start)                  yield (cursor, rows) per potongan; cursor bisa dipakai
+#                                              sebagai start untuk melanjutkan (bentuk sama dengan export_log)
+#   remote                                     True jika panggilan lewat jaringan (jalankan via SheetExecutor)
+
+def _day_bounds(date_from, date_to):
+    return (date_from.isoformat() if date_from else '', date_to.isoformat() if date_to else '9999-99-99')
+
+
+class MemoryStorage:
+    """Baris Log di memori dengan index per tanggal dan per NIP (untuk test, benchmark dan mode tee)."""
+
+    remote = False
+
+    def __init__(self):
+        self.rows = []
+        self.by_day = {}
+        self.by_nip = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _index(self, start):
+        for index in range(start, len(self.rows)):
+            row = self.rows[index]
+            self.by_day.setdefault(str(row[0])[:10], []).append(index)
+            self.by_nip.setdefault(normalize_nip(row[2]), []).append(index)
+
+    def append_rows(self, rows):
+        with self._lock:
+            start = len(self.rows)
+            self.rows.extend(list(row) for row in rows)
+            self._index(start)
+
+    def prepend_rows(self, rows):
+        """Sisipkan baris lama (isi ulang dari journal) di depan baris yang sudah masuk."""
+        with self._lock:
+            self.rows[:0] = [list(row) for row in rows]
+            # Posisi semua baris bergeser: index dibangun ulang sekali
+            self.by_day, self.by_nip = {}, {}
+            self._index(0)
+
+    def query(self, date_from=None, date_to=None, nip=None, limit=None):
+        low, high = _day_bounds(date_from, date_to)
+        with self._lock:
+            if nip:
+                indexes = [i for i in self.by_nip.get(normalize_nip(nip), ()) if low <= self.rows[i][0][:10] <= high]
+            elif date_from or date_to:
+                indexes = sorted(i for day in self.by_day if low <= day <= high for i in self.by_day[day])
+            else:
+                indexes = range(len(self.rows))
+            if limit:
+                indexes = indexes[-limit:]
+            return [self.rows[i] for i in indexes]
+
+    def stream(self, chunk_size, start=None):
+        """cursor = posisi baris berikutnya."""
+        position = start or 0
+        while True:
+            with self._lock:
+                rows = self.rows[position:position + chunk_size]
+            position += len(rows)
+            yield position, rows
+            if len(rows) < chunk_size:
+                return
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """Baris Log di SQLite lokal (WAL), di-index per tanggal dan per NIP."""
+
+    remote = False
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS log ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " day TEXT NOT NULL,"
+            " nip TEXT NOT NULL,"
+            " row TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_log_day ON log(day)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_log_nip ON log(nip, day)")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM log").fetchone()[0]
+
+    def append_rows(self, rows):
+        """Satu transaksi per batch."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT INTO log (day, nip, row) VALUES (?, ?, ?)",
+                    [(str(row[0])[:10], normalize_nip(row[2]), json.dumps(row)) for row in rows]
+                )
+
+    def query(self, date_from=None, date_to=None, nip=None, limit=None):
+        """Memakai idx_log_day / idx_log_nip sesuai filter."""
+        low, high = _day_bounds(date_from, date_to)
+        where, params = "day BETWEEN ? AND ?", [low, high]
+        if nip:
+            where += " AND nip = ?"
+            params.append(normalize_nip(nip))
+        if limit:
+            # limit baris terakhir, tetap dikembalikan urut dari yang terlama
+            sql = f"SELECT row FROM (SELECT id, row FROM log WHERE {where} ORDER BY id DESC LIMIT ?) ORDER BY id"
+            params.append(limit)
+        else:
+            sql = f"SELECT row FROM log WHERE {where} ORDER BY id"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row) for row, in rows]
+
+    def stream(self, chunk_size, start=None):
+        """cursor = id baris terakhir yang dibaca."""
+        after_id = start or 0
+        while True:
+            with self._lock:
+                entries = self._conn.execute(
+                    "SELECT id, row FROM log WHERE id > ? ORDER BY id LIMIT ?", (after_id, chunk_size)
+                ).fetchall()
+            if entries:
+                after_id = entries[-1][0]
+            yield after_id, [json.loads(row) for _, row in entries]
+            if len(entries) < chunk_size:
+                return
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SheetsStorage:
+    """Worksheet Log di Google Sheets, termasuk shard bulanan jika `shards` (MonthlyShards) diisi."""
+
+    remote = True
+
+    def __init__(self, handle, sheet_name, shards=None, chunk_size=5000):
+        self.handle = handle
+        self.sheet_name = sheet_name
+        self.shards = shards
+        self.chunk_size = chunk_size
+
+    def sheet_names(self, date_from=None, date_to=None):
+        """Worksheet Log lama + shard yang bulannya beririsan dengan rentang tanggal."""
+        if self.shards is None:
+            return [self.sheet_name]
+        return [self.sheet_name] + self.shards.names_between(date_from, date_to)
+
+    def append_rows(self, rows):
+        if self.shards is None:
+            return self.handle.call(lambda sheet: sheet.append_rows(rows), self.sheet_name)
+        # Satu append_rows per shard bulan, urutan baris tetap terjaga
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[0][:7], []).append(row)
+        for group in groups.values():
+            self.shards.append_rows(group[0][0], group)
+
+    def query(self, date_from=None, date_to=None, nip=None, limit=None):
+        """Hanya worksheet yang bulannya masuk rentang yang dibaca, per potongan (untuk export/laporan)."""
+        chunks = sheet_chunks(self.handle, self.sheet_names(date_from, date_to), self.chunk_size)
+        rows = [row for _, selected in filter_rows(chunks, date_from, date_to, nip) for row in selected]
+        return rows[-limit:] if limit else rows
+
+    def stream(self, chunk_size, start=None):
+        """cursor = [nama worksheet, baris sheet berikutnya] (header ikut terbaca)."""
+        return sheet_chunks(self.handle, self.sheet_names(), chunk_size, start=start)
+
+    def close(self):
+        pass
+
+
+class TeeStorage:
+    """Tulis dan baca dari store lokal yang cepat; `mirror` (Sheets) diisi di background oleh write-behind queue.
+
+    Journal dan store lokal ditulis terpisah (tidak atomik): jika proses mati di antara keduanya,
+    baris sudah ada di journal (dan tetap dikirim ke Sheets) tetapi tidak ada di store lokal,
+    sehingga /rekap dari store lokal bisa kurang dari Sheets. Sheets/journal adalah sumber kebenaran.
+    """
+
+    remote = False
+
+    def __init__(self, local, mirror):
+        self.local = local
+        self.mirror = mirror
+
+    def __len__(self):
+        return len(self.local)
+
+    def append_rows(self, rows):
+        self.local.append_rows(rows)
+
+    def query(self, date_from=None, date_to=None, nip=None, limit=None):
+        return self.local.query(date_from, date_to, nip, limit)
+
+    def stream(self, chunk_size, start=None):
+        return self.local.stream(chunk_size, start)
+
+    def close(self):
+        self.local.close()
+        self.mirror.close()
@@ -0,0 +1,51 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+# ====== Update Processor per User ======
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Proses update secara bersamaan (dibatasi max_concurrent_updates), tetapi
+    update dari user yang sama tetap diproses satu per satu sesuai urutan masuk
+    agar state ConversationHandler konsisten.
+    """
+
+    __slots__ = ('_locks', '_waiters')
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}
+        self._waiters = {}
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update) and update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            # Hapus lock jika tidak ada lagi update yang menunggu untuk user ini
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
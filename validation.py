@@ -0,0 +1,256 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+# ====== Registry Check ======
+# Setiap check adalah factory: params dari file rule -> predicate(fields) yang mengembalikan
+# None jika lolos, atau dict detail (untuk placeholder pesan) jika ditolak.
+CHECKS = {}
+
+
+def register_check(name):
+    def decorator(factory):
+        CHECKS[name] = factory
+        return factory
+    return decorator
+
+
+# ====== Check Teks (Nama, NIP) ======
+@register_check('not_empty')
+def not_empty(field='text'):
+    def predicate(fields):
+        return None if fields[field] else {}
+    return predicate
+
+
+@register_check('min_length')
+def min_length(min, field='text'):
+    def predicate(fields):
+        return {} if len(fields[field]) < min else None
+    return predicate
+
+
+@register_check('length_between')
+def length_between(min, max, field='text'):
+    def predicate(fields):
+        return None if min <= len(fields[field]) <= max else {}
+    return predicate
+
+
+@register_check('alpha_space')
+def alpha_space(field='text'):
+    def predicate(fields):
+        return None if fields[field].replace(' ', '').isalpha() else {}
+    return predicate
+
+
+@register_check('alnum_space')
+def alnum_space(field='text'):
+    def predicate(fields):
+        return None if fields[field].replace(' ', '').isalnum() else {}
+    return predicate
+
+
+@register_check('mixed_case')
+def mixed_case(field='text'):
+    def predicate(fields):
+        text = fields[field]
+        return {} if text.isupper() or text.islower() else None
+    return predicate
+
+
+# ====== Check Lokasi ======
+@register_check('not_zero_coordinates')
+def not_zero_coordinates():
+    def predicate(fields):
+        return {} if fields['lat'] == 0.0 and fields['lon'] == 0.0 else None
+    return predicate
+
+
+@register_check('min_decimals')
+def min_decimals(min=4):
+    # Koordinat real biasanya memiliki banyak desimal
+    def predicate(fields):
+        lat_decimals = len(str(fields['lat']).split('.')[-1])
+        lon_decimals = len(str(fields['lon']).split('.')[-1])
+        return {} if lat_decimals < min or lon_decimals < min else None
+    return predicate
+
+
+# ====== Check Foto ======
+@register_check('not_document')
+def not_document():
+    def predicate(fields):
+        return {} if fields['document'] else None
+    return predicate
+
+
+@register_check('min_file_size')
+def min_file_size(min_bytes):
+    def predicate(fields):
+        file_size = fields['file_size']
+        return {'file_size': file_size} if file_size and file_size < min_bytes else None
+    return predicate
+
+
+@register_check('aspect_ratio')
+def aspect_ratio(ratios, tolerance=0.1):
+    ratios = tuple(ratios)
+
+    def predicate(fields):
+        width, height = fields['width'], fields['height']
+        if not (width and height):
+            return None
+        ratio = width / height
+        if any(abs(ratio - valid) < tolerance for valid in ratios):
+            return None
+        return {'aspect_ratio': ratio}
+    return predicate
+
+
+@register_check('min_resolution')
+def min_resolution(min):
+    def predicate(fields):
+        width, height = fields['width'], fields['height']
+        if width and height and (width < min or height < min):
+            return {'width': width, 'height': height}
+        return None
+    return predicate
+
+
+@register_check('bytes_per_pixel')
+def bytes_per_pixel(min, max):
+    def predicate(fields):
+        file_size, width, height = fields['file_size'], fields['width'], fields['height']
+        if not (file_size and width and height):
+            return None
+        ratio = file_size / (width * height)
+        return {'bytes_per_pixel': ratio} if ratio > max or ratio < min else None
+    return predicate
+
+
+@register_check('max_seconds_since')
+def max_seconds_since(max_seconds, field='location_timestamp'):
+    def predicate(fields):
+        timestamp = fields[field]
+        if not timestamp:
+            return None
+        elapsed = (datetime.now() - datetime.fromisoformat(timestamp)).total_seconds()
+        return {'elapsed': elapsed} if elapsed > max_seconds else None
+    return predicate
+
+
+# ====== Rule & Pipeline ======
+class Rule:
+    __slots__ = ('id', 'check', 'params', 'message', 'pinned', 'predicate', 'evaluated', 'rejected', 'seconds')
+
+    def __init__(self, spec):
+        self.id = spec['id']
+        self.check = spec['check']
+        self.params = spec.get('params', {})
+        self.message = spec['message']
+        self.pinned = spec.get('pin', False)
+        factory = CHECKS.get(self.check)
+        if factory is None:
+            raise ValueError(f"rule {self.id}: check '{self.check}' tidak dikenal")
+        self.predicate = factory(**self.params)
+        self.evaluated = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+    def score(self):
+        """Perkiraan biaya per penolakan; rule dengan skor kecil sebaiknya dievaluasi lebih dulu."""
+        cost = self.seconds / self.evaluated if self.evaluated else 0.0
+        return cost / ((self.rejected + 1) / (self.evaluated + 2))
+
+
+class RuleSet:
+    """Pipeline predicate untuk satu langkah form; berhenti pada rule pertama yang menolak.
+
+    Jika adaptive, urutan rule (selain yang di-pin) diurutkan ulang setiap `reorder_every`
+    validasi berdasarkan biaya rata-rata dibagi peluang menolak.
+    """
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.adaptive = spec.get('adaptive', False)
+        self.reorder_every = spec.get('reorder_every', 200)
+        self.rules = [Rule(rule) for rule in spec['rules'] if rule.get('enabled', True)]
+        self.calls = 0
+
+    def validate(self, fields):
+        """Kembalikan (rule, detail) untuk rule pertama yang menolak, atau None jika semua lolos."""
+        result = None
+        for rule in self.rules:
+            started = time.perf_counter()
+            details = rule.predicate(fields)
+            rule.seconds += time.perf_counter() - started
+            rule.evaluated += 1
+            if details is not None:
+                rule.rejected += 1
+                result = rule, details
+                break
+        self.calls += 1
+        if self.adaptive and self.calls % self.reorder_every == 0:
+            self.reorder()
+        return result
+
+    def reorder(self):
+        pinned = [rule for rule in self.rules if rule.pinned]
+        others = sorted((rule for rule in self.rules if not rule.pinned), key=Rule.score)
+        self.rules = pinned + others
+
+
+class Validator:
+    """Rule validasi dari file JSON, dikompilasi sekali dan dimuat ulang saat file berubah.
+
+    Statistik rule (evaluasi, penolakan, waktu) dibawa ke rule dengan id yang sama setelah reload.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rulesets = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def reload(self):
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding='utf-8') as f:
+                spec = json.load(f)
+            rulesets = {name: RuleSet(name, ruleset) for name, ruleset in spec.items()}
+            previous = {(name, rule.id): rule for name, ruleset in self.rulesets.items() for rule in ruleset.rules}
+            for name, ruleset in rulesets.items():
+                for rule in ruleset.rules:
+                    old = previous.get((name, rule.id))
+                    if old is not None:
+                        rule.evaluated, rule.rejected, rule.seconds = old.evaluated, old.rejected, old.seconds
+            self.rulesets = rulesets
+            self._mtime = mtime
+        return sum(len(ruleset.rules) for ruleset in rulesets.values())
+
+    def reload_if_changed(self):
+        if os.path.getmtime(self.path) != self._mtime:
+            return self.reload()
+        return None
+
+    def validate(self, stage, fields):
+        """Pesan penolakan (Markdown) untuk langkah `stage`, atau None jika semua rule lolos."""
+        ruleset = self.rulesets.get(stage)
+        if ruleset is None:
+            return None
+        result = ruleset.validate(fields)
+        if result is None:
+            return None
+        rule, details = result
+        return rule.message.format(**rule.params, **details)
+
+    def stats(self):
+        """List (stage, rule id, evaluasi, penolakan, detik) sesuai urutan evaluasi saat ini."""
+        return [
+            (name, rule.id, rule.evaluated, rule.rejected, rule.seconds)
+            for name, ruleset in self.rulesets.items() for rule in ruleset.rules
+        ]
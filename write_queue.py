@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+
+# ====== Write-behind Queue untuk Google Sheets ======
+class SheetWriteQueue:
+    """Kumpulkan baris yang sudah dikonfirmasi lalu kirim sekaligus (batch) ke Sheets.
+
+    Baris dikirim saat batch penuh (max_batch) atau saat jendela waktu (max_delay)
+    habis. Jika flush gagal, batch yang sama dicoba ulang dengan backoff sehingga
+    tidak ada baris yang hilang atau tertukar urutannya.
+    """
+
+    def __init__(self, flush_fn, max_batch=50, max_delay=2.0, retry_base=1.0, retry_max=60.0):
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._closing = False
+
+    def put(self, row):
+        """Masukkan satu baris ke antrian tanpa menunggu (dipanggil dari handler)."""
+        self._queue.put_nowait(row)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Hentikan worker dan flush sisa baris yang masih ada di antrian."""
+        self._closing = True
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+
+    async def _collect_batch(self):
+        first = await self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                # Sinyal stop: kirim batch ini dulu, sisanya di-drain setelahnya
+                self._queue.put_nowait(None)
+                break
+            batch.append(row)
+        return batch
+
+    async def _flush_with_retry(self, batch):
+        delay = self.retry_base
+        while True:
+            try:
+                await self.flush_fn(batch)
+                return True
+            except Exception as e:
+                print(f"Error flushing {len(batch)} rows to Google Sheets: {e}")
+                if self._closing:
+                    return False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.retry_max)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            if batch is None:
+                break
+            if not await self._flush_with_retry(batch):
+                print(f"⚠️ {len(batch)} baris belum terkirim saat shutdown")
+
+        # Drain sisa antrian saat shutdown
+        remaining = []
+        while not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not None:
+                remaining.append(row)
+        for i in range(0, len(remaining), self.max_batch):
+            chunk = remaining[i:i + self.max_batch]
+            if not await self._flush_with_retry(chunk):
+                print(f"⚠️ {len(remaining) - i} baris belum terkirim saat shutdown")
+                break